@@ -0,0 +1,858 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import weakref
+from collections import OrderedDict
+import pygame
+
+
+def surface_bytes(surface):
+    """
+    计算图像占用的像素内存，子图像与父图像共用像素，不计算
+    :param surface: 图像
+    :return: 字节数
+    """
+    if surface.get_parent() is not None:
+        return 0
+    return surface.get_pitch() * surface.get_height()
+
+
+def rotated_sizes(size, steps):
+    """
+    计算图像按各个分级旋转后的尺寸，用于在渲染之前估计占用的内存
+    :param size: 未旋转的尺寸
+    :param steps: 角度的分级数
+    :return: [各分级的 (宽, 高)]
+    """
+    w, h = size
+    sizes = []
+    for i in range(steps):
+        radians = math.radians(i * 360.0 / steps)
+        c, s = abs(math.cos(radians)), abs(math.sin(radians))
+        sizes.append((int(math.ceil(w * c + h * s)), int(math.ceil(w * s + h * c))))
+    return sizes
+
+
+def mask_bytes(mask):
+    """
+    计算遮罩占用的内存，每个像素一位
+    :param mask: 遮罩
+    :return: 字节数
+    """
+    w, h = mask.get_size()
+    return (w * h + 7) // 8
+
+
+class MemoryManager(object):
+    def __init__(self, budget=None):
+        """
+        缓存的内存管理，记录各个缓存中图像和遮罩占用的内存，超过预算时丢弃最久未使用的缓存项
+        被丢弃的图像如果仍被实例引用，要等实例销毁后才会释放
+        :param budget: 内存预算，字节数；None: 不限制，此时不记录使用顺序
+        """
+        self.budget = budget
+        self.entries = OrderedDict()  # (类别, 键) -> (字节数, 丢弃时调用的函数 evict(键))，按使用顺序排列
+        self.usage = {}  # 类别 -> 字节数
+        self.total = 0
+        self.evictions = 0
+
+    def set_budget(self, budget):
+        """
+        修改内存预算，立即丢弃超出预算的缓存项
+        :param budget: 字节数；None: 不限制
+        :return: None
+        """
+        self.budget = budget
+        self.trim()
+
+    def track(self, category, key, size, evict):
+        """
+        记录一个缓存项，之后超过预算时丢弃最久未使用的缓存项，刚记录的这一项不会被丢弃，
+        否则超过预算的缓存项每次使用都要重新生成
+        :param category: 类别，如 'image'、'rotation'、'mask'
+        :param key: 缓存项在所属缓存中的键
+        :param size: 字节数
+        :param evict: 丢弃时调用的函数 evict(key)，从所属缓存中移除此项
+        :return: None
+        """
+        self.release(category, key)
+        self.entries[(category, key)] = (size, evict)
+        self.usage[category] = self.usage.get(category, 0) + size
+        self.total += size
+        self.trim((category, key))
+
+    def fits(self, size):
+        """
+        是否能在不丢弃其他缓存项的情况下再缓存这么多字节，不能时使用者应只缓存需要的部分，
+        避免整组的缓存项互相挤出预算后反复生成
+        :param size: 字节数
+        :return: bool
+        """
+        return self.budget is None or self.total + size <= self.budget
+
+    def touch(self, category, key):
+        """
+        标记缓存项被使用
+        :param category: 类别
+        :param key: 键
+        :return: None
+        """
+        if self.budget is not None and (category, key) in self.entries:
+            self.entries.move_to_end((category, key))
+
+    def release(self, category, key):
+        """
+        缓存项已被所属缓存移除，不再记录，不调用 evict
+        :param category: 类别
+        :param key: 键
+        :return: None
+        """
+        item = self.entries.pop((category, key), None)
+        if item is not None:
+            self.usage[category] -= item[0]
+            self.total -= item[0]
+
+    def release_category(self, category):
+        """
+        某个缓存已清空，不再记录此类别的缓存项
+        :param category: 类别
+        :return: None
+        """
+        for entry in [entry for entry in self.entries if entry[0] == category]:
+            self.release(*entry)
+
+    def trim(self, keep=None):
+        """
+        丢弃最久未使用的缓存项，直到不超过预算
+        :param keep: 不丢弃的缓存项 (类别, 键)，即刚记录的缓存项
+        :return: 丢弃的数量
+        """
+        n = 0
+        while self.budget is not None and self.total > self.budget and self.entries:
+            if next(iter(self.entries)) == keep:
+                break  # 刚记录的缓存项排在最后，只剩下它时停止
+            (category, key), (size, evict) = self.entries.popitem(last=False)
+            self.usage[category] -= size
+            self.total -= size
+            evict(key)
+            n += 1
+        self.evictions += n
+        return n
+
+    def stats(self):
+        """
+        内存使用的统计信息
+        :return: {'total': 总字节数, 'budget': 预算, 'entries': 缓存项数量, 'evictions': 丢弃次数,
+        'categories': {类别: 字节数}}
+        """
+        return {'total': self.total, 'budget': self.budget, 'entries': len(self.entries),
+                'evictions': self.evictions, 'categories': dict(self.usage)}
+
+
+memory = MemoryManager()  # 进程内所有缓存共用的内存管理
+
+
+class ImageCache(object):
+    def __init__(self):
+        """
+        进程内共享的图像缓存，相同的图片只从磁盘读取、解码和缩放一次
+        缓存中的图像被多个实例共用，使用者不能修改
+        """
+        self.images = {}  # (路径, rc, nums, 世界尺寸) -> 缩放后的图像
+        self.listeners = []  # 图片失效时调用的函数 listener(path)，path 为 None 表示所有图片，用于清除派生的缓存
+        self.retired = weakref.WeakValueDictionary()  # 超过预算被丢弃但仍被实例使用的图像，再次使用时直接放回缓存
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory):
+        """
+        获取图像，不在缓存中时调用 factory 生成
+        :param key: 缓存的键，第一项为图片路径
+        :param factory: 生成图像的函数，无参数
+        :return: surface 对象
+        """
+        image = self.images.get(key)
+        if image is None:
+            # 被丢弃的图像仍被实例使用时像素并未释放，放回缓存，不重新加载
+            image = self.retired.pop(key, None)
+            if image is None:
+                self.misses += 1
+                image = factory()
+            else:
+                self.hits += 1
+            self.put(key, image)
+        else:
+            self.hits += 1
+            memory.touch('image', key)
+        return image
+
+    def put(self, key, image):
+        """
+        放入已生成的图像，如预加载的图像
+        :param key: 缓存的键，第一项为图片路径
+        :param image: surface 对象
+        :return: None
+        """
+        self.images[key] = image
+        for k in [k for k, table in retired_tables.items() if table.image is image]:
+            frame_tables[k] = retired_tables.pop(k)
+        if atlas is not None and atlas.owns(image):
+            # 图集或资源包中的图像由其持有，丢弃后也不会释放内存，不记录也不丢弃
+            return
+        memory.track('image', key, surface_bytes(image), self.evict)
+
+    def evict(self, key):
+        """
+        内存超过预算时由 memory 调用，移除缓存项
+        :param key: 缓存的键
+        :return: None
+        """
+        image = self.images.pop(key, None)
+        if image is None:
+            return
+        self.retired[key] = image
+        # 帧表的子图像引用整张图像，一并移除，不再被实例使用时像素才能释放；
+        # 仍被使用时图像放回缓存后继续共用同一个帧表，旋转图像不需要重新渲染
+        for k in [k for k, table in frame_tables.items() if table.image is image]:
+            retired_tables[k] = frame_tables.pop(k)
+
+    def __contains__(self, key):
+        return key in self.images
+
+    def invalidate(self, path):
+        """
+        移除某个图片的所有缓存，图片文件改变后调用
+        :param path: 图片路径
+        :return: 移除的数量
+        """
+        keys = [key for key in self.images if key[0] == path]
+        for key in keys:
+            self.images.pop(key)
+            memory.release('image', key)
+        for key in [key for key in self.retired.keys() if key[0] == path]:
+            self.retired.pop(key, None)
+        self.notify(path)
+        return len(keys)
+
+    def notify(self, path):
+        """
+        图片失效后，移除由它派生的帧表，并通知其他派生缓存（如遮罩）
+        :param path: 图片路径；None: 所有图片
+        :return: None
+        """
+        for tables in (frame_tables, retired_tables):
+            for key in [key for key in tables.keys() if path is None or key[0][0] == path]:
+                tables.pop(key, None)
+        for listener in self.listeners:
+            listener(path)
+
+    def clear(self):
+        """
+        清空缓存和统计
+        :return: None
+        """
+        self.images.clear()
+        self.retired.clear()
+        memory.release_category('image')
+        self.notify(None)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        缓存的统计信息
+        :return: {'size': 缓存数量, 'hits': 命中次数, 'misses': 未命中次数}
+        """
+        return {'size': len(self.images), 'hits': self.hits, 'misses': self.misses}
+
+
+image_cache = ImageCache()
+
+
+def image_key(path, rc, nums, world_size):
+    """
+    实体图片在缓存中的键
+    :param path: 图片路径
+    :param rc: 一个元组(m, n)，表示图片是m*n帧的
+    :param nums: 同 Entity 的 nums
+    :param world_size: 世界的尺寸
+    :return: 键
+    """
+    return path, tuple(rc), None if nums is None else tuple(nums), tuple(world_size)
+
+DEFAULT_FONT = 'font/simfang.ttf'  # 默认字体，中文字体文件较大，解析耗时
+
+
+class FontCache(object):
+    def __init__(self):
+        """
+        进程内共享的字体缓存，相同路径和大小的字体只解析一次
+        """
+        self.fonts = {}  # (路径, 大小) -> pygame.font.Font
+
+    def get(self, path=DEFAULT_FONT, size=25):
+        """
+        获取字体，不在缓存中时加载
+        :param path: 字体文件路径，None 为 pygame 的默认字体
+        :param size: 字体大小
+        :return: pygame.font.Font
+        """
+        key = (path, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.Font(path, size)
+        return font
+
+    def warm(self, specs):
+        """
+        预先加载字体，在启动时调用，避免第一次显示界面时卡顿
+        :param specs: (路径, 大小) 的列表
+        :return: None
+        """
+        for path, size in specs:
+            self.get(path, size)
+
+    def clear(self):
+        """
+        清空缓存
+        :return: None
+        """
+        self.fonts.clear()
+
+
+font_cache = FontCache()
+
+
+class FrameTable(object):
+    def __init__(self, image, rc):
+        """
+        将精灵图一次性切分成各帧，之后播放动画只需按 (行, 列) 查表
+        创建后不再修改，可以被多个实例共用
+        :param image: 精灵图
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        """
+        w, h = image.get_size()
+        self.image = image
+        self.key = None  # 共用时的标识 ((图片路径, 尺寸), rc)，用于磁盘缓存
+        self.frame_width = w / rc[0]
+        self.frame_height = h / rc[1]
+        self.frames = {}  # (行, 列) -> 帧的图像
+        self.rects = {}  # (行, 列) -> 帧在精灵图中的区域 (x, y, w, h)
+        for row in range(rc[1]):
+            for col in range(rc[0]):
+                rect = (col * self.frame_width, row * self.frame_height, self.frame_width, self.frame_height)
+                self.frames[(row, col)] = image.subsurface(rect)
+                self.rects[(row, col)] = rect
+
+
+frame_tables = {}  # (图像的标识, rc) -> 共用的帧表
+retired_tables = weakref.WeakValueDictionary()  # 图像被丢弃后仍被实例使用的帧表
+
+
+def frame_table(image, rc, key=None):
+    """
+    获取精灵图的帧表，相同标识的图像共用一个帧表
+    :param image: 精灵图
+    :param rc: 一个元组(m, n)，表示图片是m*n帧的
+    :param key: 图像的标识，None: 不共用，创建新的帧表
+    :return: FrameTable
+    """
+    if key is None:
+        return FrameTable(image, rc)
+    table = frame_tables.get((key, rc))
+    if table is None:
+        table = frame_tables[(key, rc)] = FrameTable(image, rc)
+        table.key = (key, rc)
+    return table
+
+
+class RotationCache(object):
+    def __init__(self, steps=64):
+        """
+        旋转图像的缓存，将角度按 360 / steps 分级，每个 (图像, 帧) 预先渲染所有分级的旋转图像，
+        运行时只需选取最接近的一张，不再调用 pygame.transform.rotate；
+        内存预算放不下所有分级时只渲染用到的分级，每个分级单独记录内存
+        :param steps: 角度的分级数，例如 64 或 128
+        """
+        self.steps = steps
+        self.frames = weakref.WeakKeyDictionary()  # 帧表 -> {(行, 列): [各分级的 (图像, 尺寸)]}
+        self.refs = {}  # id(帧表) -> 帧表的弱引用，帧表销毁时不再记录其内存
+
+    def set_steps(self, steps):
+        """
+        修改角度的分级数，已缓存的图像全部丢弃
+        :param steps: 分级数
+        :return: None
+        """
+        self.steps = steps
+        self.clear()
+
+    def step(self, angle):
+        """
+        计算角度对应的分级
+        :param angle: 角度，角度制
+        :return: 分级序号
+        """
+        return int(round(angle * self.steps / 360.0)) % self.steps
+
+    def get(self, table, frame, angle):
+        """
+        获取旋转后的帧，所有分级的旋转图像超过内存预算时只渲染需要的分级
+        :param table: 帧表
+        :param frame: 帧的 (行, 列)
+        :param angle: 旋转角度，角度制
+        :return: (图像, 尺寸)
+        """
+        cached = self.frames.get(table)
+        if cached is None:
+            cached = self.frames[table] = {}
+        rotated = cached.get(frame)
+        if rotated is None:
+            rotated = cached[frame] = [None] * self.steps
+        step = self.step(angle)
+        item = rotated[step]
+        if item is None:
+            surface = table.frames[frame]
+            if step == 0:
+                # 不旋转的帧（例如人物）不需要渲染其他角度
+                rotated[0] = item = (surface, surface.get_size())
+            elif memory.fits(self.estimate(surface)):
+                self.prerender(surface, rotated, table, frame)
+                item = rotated[step]
+                self.track(table, frame, sum(surface_bytes(image) for image, _ in rotated[1:]))
+            else:
+                image = pygame.transform.rotate(surface, step * 360.0 / self.steps)
+                rotated[step] = item = (image, image.get_size())
+                self.track(table, frame + (step,), surface_bytes(image))
+        elif step != 0:
+            memory.touch('rotation', (id(table), frame))
+            memory.touch('rotation', (id(table), frame + (step,)))
+        return item
+
+    def estimate(self, surface):
+        """
+        估计一帧所有分级的旋转图像占用的内存
+        :param surface: 未旋转的帧
+        :return: 字节数
+        """
+        return sum(w * h for w, h in rotated_sizes(surface.get_size(), self.steps)[1:]) * surface.get_bytesize()
+
+    def track(self, table, frame, size):
+        """
+        记录渲染好的旋转图像占用的内存
+        :param table: 帧表
+        :param frame: 帧的 (行, 列)，只渲染了一个分级时为 (行, 列, 分级)
+        :param size: 字节数
+        :return: None
+        """
+        tid = id(table)
+        if tid not in self.refs:
+            self.refs[tid] = weakref.ref(table, lambda ref, tid=tid: self.forget(tid))
+        memory.track('rotation', (tid, frame), size, self.evict)
+
+    def evict(self, key):
+        """
+        内存超过预算时由 memory 调用，丢弃一帧的旋转图像
+        :param key: (id(帧表), 帧)，帧为 (行, 列, 分级) 时只丢弃这个分级
+        :return: None
+        """
+        tid, frame = key
+        ref = self.refs.get(tid)
+        table = ref() if ref is not None else None
+        if table is None or table not in self.frames:
+            return
+        cached = self.frames[table]
+        if len(frame) == 2:
+            cached.pop(frame, None)
+        elif frame[:2] in cached:
+            rotated = cached[frame[:2]]
+            if frame[2] < len(rotated):
+                rotated[frame[2]] = None
+
+    def forget(self, tid):
+        """
+        帧表已销毁，不再记录其旋转图像的内存
+        :param tid: id(帧表)
+        :return: None
+        """
+        self.refs.pop(tid, None)
+        if memory is None:  # 解释器退出时模块变量已被清理
+            return
+        for category, key in [entry for entry in memory.entries if entry[0] == 'rotation' and entry[1][0] == tid]:
+            memory.release(category, key)
+
+    def prerender(self, surface, rotated, table=None, frame=None):
+        """
+        渲染所有分级的旋转图像，帧表来自图片文件且开启了磁盘缓存时，优先从磁盘读取
+        :param surface: 未旋转的帧
+        :param rotated: 保存结果的列表
+        :param table: 帧所在的帧表
+        :param frame: 帧的 (行, 列)
+        :return: None
+        """
+        steps = self.steps
+        if disk_cache is not None and table is not None and table.key is not None:
+            (path, size), rc = table.key
+            if isinstance(path, str):
+                def render():
+                    return [pygame.transform.rotate(surface, i * 360.0 / steps) for i in range(1, steps)]
+                images = disk_cache.get(path, ('rotate', tuple(size), rc, frame, steps), render)
+                rotated[0] = (surface, surface.get_size())
+                for i, image in enumerate(images, 1):
+                    rotated[i] = (image, image.get_size())
+                return
+        for i in range(steps):
+            if rotated[i] is None:
+                if i == 0:
+                    image = surface
+                else:
+                    image = pygame.transform.rotate(surface, i * 360.0 / steps)
+                rotated[i] = (image, image.get_size())
+
+    def clear(self):
+        """
+        清空缓存
+        :return: None
+        """
+        self.frames = weakref.WeakKeyDictionary()
+        self.refs.clear()
+        memory.release_category('rotation')
+
+
+rotation_cache = RotationCache()
+
+
+class Atlas(object):
+    def __init__(self, surface, meta):
+        """
+        图集，所有图像都是同一张图像的子图像，绘制时只从一张图像读取像素
+        :param surface: 图集图像
+        :param meta: 图集的描述信息，由 atlas.py 生成
+        """
+        self.surface = surface
+        self.meta = meta
+        self.entries = {}  # (路径, rc, nums, 世界尺寸, 是否拉伸) -> 描述
+        world = tuple(meta['world'])
+        for entry in meta['entries']:
+            nums = entry['nums']
+            key = (os.path.normpath(entry['source']), tuple(entry['rc']), None if nums is None else tuple(nums),
+                   world, entry['stretch'])
+            self.entries[key] = entry
+
+    @classmethod
+    def load(cls, path):
+        """
+        加载图集，只需解码一张图片
+        :param path: 图集路径，不含扩展名，对应 path.png 和 path.json
+        :return: Atlas
+        """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        surface = pygame.image.load(os.path.join(os.path.dirname(path), meta['image'])).convert_alpha()
+        return cls(surface, meta)
+
+    def entry(self, path, rc, nums, world_size, stretch=False):
+        """
+        查找图片的描述
+        :param path: 图片路径
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :param nums: 同 Entity 的 nums
+        :param world_size: 世界的尺寸
+        :param stretch: 是否为拉伸到世界大小的图片
+        :return: 描述；None: 图集中没有按此参数缩放的图片
+        """
+        key = (os.path.normpath(path), tuple(rc) if rc is not None else (1, 1),
+               None if nums is None else tuple(nums), tuple(world_size), stretch)
+        return self.entries.get(key)
+
+    def get(self, path, rc, nums, world_size, stretch=False):
+        """
+        获取图集中缩放好的图像
+        :param path: 图片路径
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :param nums: 同 Entity 的 nums
+        :param world_size: 世界的尺寸
+        :param stretch: 是否为拉伸到世界大小的图片
+        :return: 图集的子图像；None: 图集中没有按此参数缩放的图片
+        """
+        entry = self.entry(path, rc, nums, world_size, stretch)
+        if entry is None:
+            return None
+        return self.surface.subsurface(entry['rect'])
+
+    def owns(self, surface):
+        """
+        图像是否来自图集，这些图像的像素由图集持有
+        :param surface: 图像
+        :return: bool
+        """
+        return surface.get_parent() is self.surface
+
+
+class Bundle(Atlas):
+    MAGIC = b'PGSB'
+    ALIGN = 16  # 每个图像数据的起始位置按此字节数对齐
+
+    def __init__(self, buffer, meta, base):
+        """
+        资源包，保存缩放好的未压缩像素，映射到内存后直接作为图像使用
+        :param buffer: 资源包文件映射的内存
+        :param meta: 资源包的描述信息，由 bundle.py 生成
+        :param base: 图像数据的起始位置，描述中的偏移相对于此位置
+        """
+        super(Bundle, self).__init__(None, meta)
+        self.buffer = buffer
+        self.base = base
+        self.view = memoryview(buffer)
+        self.surfaces = {}  # 图片路径 -> 图像，同一个缓冲区只包装一次
+
+    @classmethod
+    def align(cls, offset):
+        """
+        按 ALIGN 对齐
+        :param offset: 偏移
+        :return: 对齐后的偏移
+        """
+        return (offset + cls.ALIGN - 1) // cls.ALIGN * cls.ALIGN
+
+    @classmethod
+    def header_size(cls, length):
+        """
+        文件头（标识、描述信息的长度和描述信息）对齐后的大小，即图像数据的起始位置
+        :param length: 描述信息的字节数
+        :return: 字节数
+        """
+        return cls.align(len(cls.MAGIC) + 4 + length)
+
+    @classmethod
+    def load(cls, path):
+        """
+        映射资源包文件，不读取也不解码像素
+        :param path: 资源包路径
+        :return: Bundle
+        """
+        with open(path, 'rb') as f:
+            # ACCESS_COPY: 写入图像时只修改进程内的副本，不会改动文件
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        n = len(cls.MAGIC)
+        if buffer[:n] != cls.MAGIC:
+            buffer.close()
+            raise ValueError('not an asset bundle: %s' % path)
+        length, = struct.unpack('<I', buffer[n:n + 4])
+        meta = json.loads(buffer[n + 4:n + 4 + length].decode('utf-8'))
+        return cls(buffer, meta, cls.header_size(length))
+
+    def get(self, path, rc, nums, world_size, stretch=False):
+        """
+        获取资源包中缩放好的图像，图像直接引用映射的内存，不复制像素
+        :param path: 图片路径
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :param nums: 同 Entity 的 nums
+        :param world_size: 世界的尺寸
+        :param stretch: 是否为拉伸到世界大小的图片
+        :return: 图像；None: 资源包中没有按此参数缩放的图片
+        """
+        entry = self.entry(path, rc, nums, world_size, stretch)
+        if entry is None:
+            return None
+        surface = self.surfaces.get(entry['source'])
+        if surface is None:
+            w, h = entry['size']
+            offset = self.base + entry['offset']
+            data = self.view[offset:offset + w * h * 4]
+            surface = pygame.image.frombuffer(data, (w, h), self.meta['format'])
+            self.surfaces[entry['source']] = surface
+        return surface
+
+    def owns(self, surface):
+        """
+        图像是否来自资源包，这些图像直接引用映射的内存
+        :param surface: 图像
+        :return: bool
+        """
+        return any(surface is image for image in self.surfaces.values())
+
+
+def pixel_format():
+    """
+    保存未压缩像素时使用的格式，优先使用与 convert_alpha 后的显示格式一致的 BGRA
+    :return: 格式字符串
+    """
+    try:
+        pygame.image.tostring(pygame.Surface((1, 1), flags=pygame.SRCALPHA, depth=32), 'BGRA')
+    except ValueError:  # 旧版本的 pygame 不支持 BGRA
+        return 'RGBA'
+    return 'BGRA'
+
+
+class DiskCache(object):
+    MAGIC = b'PGSC'
+
+    def __init__(self, directory):
+        """
+        缩放、旋转后图像的磁盘缓存，按源文件内容的哈希和处理参数寻址，以未压缩的像素保存，
+        之后的运行和其他进程直接读取，不需要重新计算；源文件改变后哈希不同，旧的缓存不再使用
+        :param directory: 缓存目录
+        """
+        self.directory = directory
+        self.format = pixel_format()
+        self.digests = {}  # 图片路径 -> (修改时间, 文件大小, 内容的哈希)
+
+    def digest(self, path):
+        """
+        计算源文件内容的哈希，文件未改变时不重新计算
+        :param path: 图片路径
+        :return: 十六进制字符串
+        """
+        st = os.stat(path)
+        cached = self.digests.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self.digests[path] = (st.st_mtime, st.st_size, digest)
+        return digest
+
+    def filename(self, path, params):
+        """
+        缓存文件的路径
+        :param path: 图片路径
+        :param params: 处理参数
+        :return: 路径
+        """
+        name = hashlib.sha1((self.digest(path) + repr(params) + self.format).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.raw')
+
+    def load(self, filename):
+        """
+        读取缓存文件
+        :param filename: 缓存文件的路径
+        :return: 图像列表；None: 文件不存在或已损坏
+        """
+        try:
+            with open(filename, 'rb') as f:
+                data = bytearray(f.read())
+        except IOError:
+            return None
+        n = len(self.MAGIC)
+        if data[:n] != self.MAGIC:
+            return None
+        view = memoryview(data)
+        images = []
+        try:
+            count, = struct.unpack_from('<I', data, n)
+            offset = n + 4
+            for i in range(count):
+                w, h = struct.unpack_from('<II', data, offset)
+                offset += 8
+                if offset + w * h * 4 > len(data):
+                    return None
+                images.append(pygame.image.frombuffer(view[offset:offset + w * h * 4], (w, h), self.format))
+                offset += w * h * 4
+        except (struct.error, ValueError):  # 文件不完整，当作没有缓存
+            return None
+        return images
+
+    def save(self, filename, images):
+        """
+        写入缓存文件，先写入临时文件再替换，多个进程同时写入时不会读到不完整的文件
+        :param filename: 缓存文件的路径
+        :param images: 图像列表
+        :return: 是否写入成功；目录不可写、磁盘已满等情况下不写入，不影响游戏
+        """
+        # 临时文件名包含进程和线程，预加载的多个线程同时写入同一个缓存时不会冲突
+        temp = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, 'wb') as f:
+                f.write(self.MAGIC)
+                f.write(struct.pack('<I', len(images)))
+                for image in images:
+                    f.write(struct.pack('<II', *image.get_size()))
+                    f.write(pygame.image.tostring(image, self.format))
+            os.replace(temp, filename)
+        except OSError:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def get(self, path, params, factory):
+        """
+        获取处理后的图像，缓存中没有时调用 factory 计算并保存
+        :param path: 源图片路径
+        :param params: 处理参数，可 repr 的元组，如 ('scale', rc, nums, 世界尺寸)
+        :param factory: 计算图像列表的函数，无参数
+        :return: 图像列表
+        """
+        filename = self.filename(path, params)
+        images = self.load(filename)
+        if images is None:
+            images = factory()
+            self.save(filename, images)
+        return images
+
+    def clear(self):
+        """
+        删除所有缓存文件
+        :return: 删除的数量
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        names = [name for name in os.listdir(self.directory) if name.endswith('.raw')]
+        for name in names:
+            os.remove(os.path.join(self.directory, name))
+        return len(names)
+
+
+disk_cache = None  # 磁盘缓存，None: 不使用
+
+
+def use_disk_cache(directory):
+    """
+    使用磁盘缓存
+    :param directory: 缓存目录；None: 不使用
+    :return: DiskCache 或 None
+    """
+    global disk_cache
+    disk_cache = DiskCache(directory) if directory is not None else None
+    return disk_cache
+
+
+atlas = None  # 当前使用的图集或资源包
+
+
+def use_atlas(path):
+    """
+    使用图集，之后加载的图片优先从图集中获取；图集文件不存在时不使用
+    :param path: 图集路径，不含扩展名
+    :return: Atlas；None: 图集不存在
+    """
+    global atlas
+    if os.path.exists(path + '.json'):
+        atlas = Atlas.load(path)
+    else:
+        atlas = None
+    image_cache.clear()
+    return atlas
+
+
+def use_bundle(path):
+    """
+    使用资源包，之后加载的图片优先从资源包中获取；资源包不存在时不使用
+    :param path: 资源包路径
+    :return: Bundle；None: 资源包不存在
+    """
+    global atlas
+    if os.path.exists(path):
+        atlas = Bundle.load(path)
+    else:
+        atlas = None
+    image_cache.clear()
+    return atlas
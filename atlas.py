@@ -0,0 +1,108 @@
+import glob
+import json
+import math
+import os
+import sys
+import pygame
+from gameobjects.util import next_power_of_2
+from entity import image_scale
+import media
+
+
+def pack(sizes, padding=1):
+    """
+    按行排列矩形（shelf packing），先放高的矩形
+    :param sizes: 各矩形的尺寸
+    :param padding: 矩形之间的间隔
+    :return: (各矩形的位置, 图集的尺寸)
+    """
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    widest = max(w for w, h in sizes) + padding
+    width = next_power_of_2(max(widest, int(math.sqrt(area))))
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if x + w > width:
+            x = 0
+            y += shelf + padding
+            shelf = 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf = max(shelf, h)
+    return positions, (width, y + shelf)
+
+
+def prepare(world_size=(800, 600), media_dir='media', exclude=()):
+    """
+    将 media 目录下的图片按游戏中使用的大小缩放，旁边有同名 .json 描述文件的图片是生成的图集，跳过
+    :param world_size: 世界的尺寸，图片按此尺寸缩放
+    :param media_dir: 图片目录
+    :param exclude: 跳过的图片路径（生成的图集等）
+    :return: (缩放后的图像列表, 对应的描述列表)
+    """
+    specs = dict((os.path.normpath(path), (rc, nums)) for path, rc, nums in media.SPRITES)
+    background = os.path.normpath(media.BACKGROUND)
+    exclude = set(os.path.normpath(path) for path in exclude)
+    images = []
+    entries = []
+    for path in sorted(glob.glob(os.path.join(media_dir, '*.png'))):
+        path = os.path.normpath(path)
+        if path in exclude or os.path.exists(os.path.splitext(path)[0] + '.json'):
+            continue
+        source = pygame.image.load(path)
+        stretch = path == background
+        rc, nums = specs.get(path, ((1, 1), None))
+        if stretch:
+            image = pygame.transform.scale(source, world_size)
+            scale = [world_size[0] / float(source.get_width()), world_size[1] / float(source.get_height())]
+        else:
+            scale = image_scale(source.get_size(), rc, nums, world_size)
+            image = pygame.transform.rotozoom(source, 0, scale)
+        w, h = image.get_size()
+        fw, fh = w / rc[0], h / rc[1]
+        frames = [[col * fw, row * fh, fw, fh] for row in range(rc[1]) for col in range(rc[0])]
+        images.append(image)
+        entries.append({'source': path.replace(os.sep, '/'),
+                        'source_size': list(source.get_size()),
+                        'scale': scale,
+                        'stretch': stretch,
+                        'rc': list(rc),
+                        'nums': None if nums is None else list(nums),
+                        'frames': frames,
+                        'pivots': [[fw / 2.0, fh / 2.0]] * len(frames)})
+    return images, entries
+
+
+def build(output='media/atlas', world_size=(800, 600), media_dir='media', padding=1):
+    """
+    将 media 目录下的图片按游戏中使用的大小缩放后打包成一张图集，并生成描述文件
+    :param output: 输出路径，不含扩展名，生成 output.png 和 output.json
+    :param world_size: 世界的尺寸，图片按此尺寸缩放
+    :param media_dir: 图片目录
+    :param padding: 图片之间的间隔
+    :return: 描述信息
+    """
+    target = os.path.normpath(output + '.png')
+    images, entries = prepare(world_size, media_dir, exclude=(target,))
+
+    positions, size = pack([image.get_size() for image in images], padding)
+    surface = pygame.Surface(size, flags=pygame.SRCALPHA, depth=32)
+    for image, entry, position in zip(images, entries, positions):
+        surface.blit(image, position)
+        entry['rect'] = list(position) + list(image.get_size())
+
+    meta = {'image': os.path.basename(target), 'world': list(world_size), 'entries': entries}
+    pygame.image.save(surface, target)
+    with open(output + '.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+if __name__ == '__main__':
+    # python atlas.py [输出路径] [宽] [高]
+    args = sys.argv[1:]
+    out = args[0] if args else 'media/atlas'
+    ws = (int(args[1]), int(args[2])) if len(args) >= 3 else (800, 600)
+    m = build(out, ws)
+    print('%s.png: %d images' % (out, len(m['entries'])))
@@ -5,28 +5,37 @@ import math
 
 class BounceBullet(Bullet):
     cold_down = 500
+    asset = ('media/bullet-png-39228.png', (1, 1), (20, 24))  # (图片路径, rc, nums)，与 Bullet 默认的 rc 参数一致
 
     def __init__(self, world, parent, position, heading):
         super(BounceBullet, self).__init__(world, 'bounce', parent, position, heading,
-                                           52, 'media/bullet-png-39228.png', 10)
+                                           52, self.asset[0], 10)
 
-    def collide_callback(self, group_name, entity):
-        if group_name == 'edge':
-            edge = entity.name
-            x, y = self.heading
-            if (edge == 'left' and x < 0) or (edge == 'right' and x > 0):
-                self.heading *= (-1, 1)
-            if (edge == 'top' and y < 0) or (edge == 'bottom' and y > 0):
-                self.heading *= (1, -1)
-            return
-        super(BounceBullet, self).collide_callback(group_name, entity)
+    def hit_edge(self, edge):
+        self.reflect(edge.name)
+
+    def bounds_callback(self, side, bounds):
+        self.reflect(side)
+
+    def reflect(self, edge):
+        """
+        碰到边界时反弹
+        :param edge: 边界，'left', 'right', 'top', 'bottom'
+        :return: None
+        """
+        x, y = self.heading
+        if (edge == 'left' and x < 0) or (edge == 'right' and x > 0):
+            self.heading *= (-1, 1)
+        if (edge == 'top' and y < 0) or (edge == 'bottom' and y > 0):
+            self.heading *= (1, -1)
 
 
 class SpiralsBullet(Bullet):
     cold_down = 500
+    asset = ('media/spirals.png', (1, 1), (20, 24))
 
     def __init__(self, world, parent, position, heading):
-        super(SpiralsBullet, self).__init__(world, 'spirals', parent, position, heading, 52, 'media/spirals.png', 10)
+        super(SpiralsBullet, self).__init__(world, 'spirals', parent, position, heading, 52, self.asset[0], 10)
         self.action_angle = math.pi * 0.3
         self.origin_point = Vector2(position)
 
@@ -57,13 +66,17 @@ class SpiralsBullet(Bullet):
                 return 0
         return super(SpiralsBullet, self).get_damage(entity)
 
-    def collide_callback(self, group_name, entity):
-        if entity == self.parent:
+    def hit_target(self, role):
+        if role == self.parent:
             if self.position.get_distance_to(self.origin_point) < 100:
                 return
-        if group_name == 'edge':
-            return
-        super(SpiralsBullet, self).collide_callback(group_name, entity)
+        super(SpiralsBullet, self).hit_target(role)
+
+    def hit_edge(self, edge):
+        pass
+
+    def bounds_callback(self, side, bounds):
+        pass
 
     def adjust_position(self):
         pass
@@ -0,0 +1,47 @@
+import json
+import struct
+import sys
+import pygame
+import assets
+from atlas import prepare
+
+
+def build(output='media/assets.bundle', world_size=(800, 600), media_dir='media'):
+    """
+    将 media 目录下的图片按游戏中使用的大小缩放后，以未压缩的像素写入资源包，运行时映射到内存直接使用，无需解码
+    :param output: 输出路径
+    :param world_size: 世界的尺寸，图片按此尺寸缩放
+    :param media_dir: 图片目录
+    :return: 描述信息
+    """
+    images, entries = prepare(world_size, media_dir)
+    fmt = assets.pixel_format()
+    buffers = [pygame.image.tostring(image, fmt) for image in images]
+    meta = {'format': fmt, 'world': list(world_size), 'entries': entries}
+
+    # 偏移相对于图像数据的起始位置，与描述信息的长度无关
+    offset = 0
+    for image, entry, data in zip(images, entries, buffers):
+        entry['offset'] = offset
+        entry['size'] = list(image.get_size())
+        offset = assets.Bundle.align(offset + len(data))
+    head = json.dumps(meta).encode('utf-8')
+    base = assets.Bundle.header_size(len(head))
+
+    with open(output, 'wb') as f:
+        f.write(assets.Bundle.MAGIC)
+        f.write(struct.pack('<I', len(head)))
+        f.write(head)
+        for entry, data in zip(entries, buffers):
+            f.write(b'\0' * (base + entry['offset'] - f.tell()))
+            f.write(data)
+    return meta
+
+
+if __name__ == '__main__':
+    # python bundle.py [输出路径] [宽] [高]
+    args = sys.argv[1:]
+    out = args[0] if args else 'media/assets.bundle'
+    ws = (int(args[1]), int(args[2])) if len(args) >= 3 else (800, 600)
+    m = build(out, ws)
+    print('%s: %d images' % (out, len(m['entries'])))
@@ -1,6 +1,7 @@
 import pygame
 from pygame.locals import *
 from pygame.sprite import *
+from assets import font_cache, DEFAULT_FONT
 
 
 class Button(Sprite):
@@ -39,13 +40,13 @@ class TextButton(Button):
         self.image = None
         fs = font
         if font is None:
-            fs = pygame.font.Font('font/simfang.ttf', 25)
+            fs = font_cache.get(DEFAULT_FONT, 25)
         elif isinstance(font, (float, int)):
-            fs = pygame.font.Font('font/simfang.ttf', font)
+            fs = font_cache.get(DEFAULT_FONT, font)
         elif isinstance(font, str):
-            fs = pygame.font.Font(font, 25)
+            fs = font_cache.get(font, 25)
         elif isinstance(font, tuple):
-            fs = pygame.font.Font(font[0], font[1])
+            fs = font_cache.get(font[0], font[1])
         if isinstance(bg, str):
             self.image = pygame.image.load(bg).convert_alpha()
         else:
@@ -0,0 +1,636 @@
+import math
+import bisect
+import pygame
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from gameobjects.grid import Grid
+from gameobjects.locals import WRAP_NONE
+from gameobjects.util import saturate
+from assets import memory, mask_bytes, rotated_sizes, image_cache, rotation_cache
+
+
+def scale_rect(rect, ratio):
+    """
+    按比例缩放矩形，计算方式与 sprite.collide_rect_ratio 一致
+    :param rect: 矩形
+    :param ratio: 缩放比例
+    :return: 缩放后的矩形
+    """
+    w, h = rect.size
+    return rect.inflate(w * ratio - w, h * ratio - h)
+
+
+class MaskCache(object):
+    def __init__(self):
+        """
+        像素遮罩的缓存，每个 (图像, 帧) 预先生成所有旋转角度的遮罩，之后只需查表
+        角度的分级与 rotation_cache 相同，遮罩与绘制的图像使用同一个角度
+        """
+        self.masks = {}  # (图像, 帧) -> [各个角度的遮罩]
+        self.solids = {}  # 尺寸 -> 填满的遮罩
+
+    def step(self, angle):
+        """
+        计算角度对应的分级
+        :param angle: 角度，角度制
+        :return: 分级序号
+        """
+        return rotation_cache.step(angle)
+
+    def frame_masks(self, key, image, frame):
+        """
+        获取帧在所有角度下的遮罩，不存在或角度的分级数改变时生成；
+        所有角度的遮罩超过内存预算时不预先生成，列表中为 None，使用时由 get 生成单个角度
+        :param key: 图像的标识，相同标识的图像共用遮罩
+        :param image: 整张图像
+        :param frame: 帧在图像中的区域 (x, y, w, h)
+        :return: 遮罩列表
+        """
+        steps = rotation_cache.steps
+        masks = self.masks.get((key, frame))
+        if masks is None or len(masks) != steps:
+            masks = self.masks[(key, frame)] = [None] * steps
+            size = sum((w * h + 7) // 8 for w, h in rotated_sizes(frame[2:], steps))
+            if memory.fits(size):
+                surface = image.subsurface(frame)
+                masks[:] = [pygame.mask.from_surface(pygame.transform.rotate(surface, i * 360.0 / steps))
+                            for i in range(steps)]
+                memory.track('mask', (key, frame), sum(mask_bytes(mask) for mask in masks), self.evict)
+        else:
+            memory.touch('mask', (key, frame))
+        return masks
+
+    def prepare(self, key, image, frames):
+        """
+        预先生成多个帧的遮罩，在创建实体或预加载时调用，碰撞检测时不再生成
+        :param key: 图像的标识
+        :param image: 整张图像
+        :param frames: 帧在图像中的区域的列表
+        :return: None
+        """
+        for frame in frames:
+            self.frame_masks(key, image, frame)
+
+    def get(self, key, image, frame, angle):
+        """
+        获取帧在某个角度下的遮罩
+        :param key: 图像的标识，相同标识的图像共用遮罩
+        :param image: 整张图像
+        :param frame: 帧在图像中的区域 (x, y, w, h)
+        :param angle: 旋转角度，角度制
+        :return: 遮罩
+        """
+        masks = self.frame_masks(key, image, frame)
+        step = self.step(angle)
+        mask = masks[step]
+        if mask is None:
+            surface = pygame.transform.rotate(image.subsurface(frame), step * 360.0 / len(masks))
+            mask = masks[step] = pygame.mask.from_surface(surface)
+            memory.track('mask', (key, frame, step), mask_bytes(mask), self.evict)
+        else:
+            memory.touch('mask', (key, frame, step))
+        return mask
+
+    def evict(self, key):
+        """
+        内存超过预算时由 memory 调用，丢弃一帧的遮罩
+        :param key: (图像的标识, 帧)；(图像的标识, 帧, 分级) 时只丢弃这个分级
+        :return: None
+        """
+        if len(key) == 2:
+            self.masks.pop(key, None)
+            return
+        masks = self.masks.get(key[:2])
+        if masks is not None and key[2] < len(masks):
+            masks[key[2]] = None
+
+    def solid(self, size):
+        """
+        获取一个填满的遮罩，用于未开启像素检测的精灵
+        :param size: 尺寸
+        :return: 遮罩
+        """
+        mask = self.solids.get(size)
+        if mask is None:
+            mask = self.solids[size] = pygame.mask.Mask(size, fill=True)
+        return mask
+
+    def clear(self):
+        """
+        清空缓存
+        :return: None
+        """
+        self.masks.clear()
+        self.solids.clear()
+        memory.release_category('mask')
+
+    def invalidate(self, path):
+        """
+        移除某个图片的遮罩，图片文件改变后由 image_cache 调用
+        :param path: 图片路径；None: 所有图片
+        :return: None
+        """
+        for key in [key for key in self.masks if path is None or key[0][0] == path]:
+            for step in range(len(self.masks.pop(key))):
+                memory.release('mask', key + (step,))
+            memory.release('mask', key)
+
+
+mask_cache = MaskCache()
+image_cache.listeners.append(mask_cache.invalidate)
+
+
+class SpatialHash(Grid):
+    def __init__(self, width, height, cell_size=64):
+        """
+        均匀网格的空间哈希，用于碰撞的粗检测
+        :param width: 世界的宽度
+        :param height: 世界的高度
+        :param cell_size: 格子的边长，像素
+        """
+        self.cell_size = cell_size
+        cols = max(1, int(math.ceil(width / float(cell_size))))
+        rows = max(1, int(math.ceil(height / float(cell_size))))
+        super(SpatialHash, self).__init__(lambda x, y: dict(), cols, rows, WRAP_NONE, WRAP_NONE)
+        self.ranges = {}  # 精灵 -> 所在格子的范围 (x0, y0, x1, y1)
+
+    def cell_range(self, rect):
+        """
+        计算矩形覆盖的格子范围，超出世界的部分归入边界上的格子
+        :param rect: 矩形
+        :return: (x0, y0, x1, y1)，包含两端
+        """
+        cs = self.cell_size
+        w, h = self.width - 1, self.height - 1
+        x0 = saturate(int(rect.left // cs), 0, w)
+        y0 = saturate(int(rect.top // cs), 0, h)
+        x1 = saturate(int(rect.right // cs), 0, w)
+        y1 = saturate(int(rect.bottom // cs), 0, h)
+        return x0, y0, x1, y1
+
+    def move(self, sp, rect):
+        """
+        更新精灵在网格中的位置，所在格子没有变化时不做任何事
+        :param sp: 精灵
+        :param rect: 精灵的碰撞矩形
+        :return: None
+        """
+        r = self.cell_range(rect)
+        old = self.ranges.get(sp)
+        if old == r:
+            return
+        if old is not None:
+            self.unlink(sp, old)
+        x0, y0, x1, y1 = r
+        nodes = self.nodes
+        for y in range(y0, y1 + 1):
+            row = nodes[y]
+            for x in range(x0, x1 + 1):
+                row[x][sp] = None
+        self.ranges[sp] = r
+
+    def unlink(self, sp, r):
+        x0, y0, x1, y1 = r
+        nodes = self.nodes
+        for y in range(y0, y1 + 1):
+            row = nodes[y]
+            for x in range(x0, x1 + 1):
+                row[x].pop(sp, None)
+
+    def remove(self, sp):
+        """
+        从网格中移除精灵
+        :param sp: 精灵
+        :return: None
+        """
+        r = self.ranges.pop(sp, None)
+        if r is not None:
+            self.unlink(sp, r)
+
+    def update(self, sprites, rect_func):
+        """
+        同步网格：移除已不存在的精灵，并重新放置移动过的精灵
+        :param sprites: 当前所有的精灵
+        :param rect_func: 计算精灵碰撞矩形的函数
+        :return: None
+        """
+        for sp in [sp for sp in self.ranges if sp not in sprites]:
+            self.remove(sp)
+        for sp in sprites:
+            self.move(sp, rect_func(sp))
+
+    def query(self, rect):
+        """
+        查询与矩形所在格子相邻的精灵
+        :param rect: 矩形
+        :return: 候选精灵的集合
+        """
+        x0, y0, x1, y1 = self.cell_range(rect)
+        nodes = self.nodes
+        if x0 == x1 and y0 == y1:
+            return nodes[y0][x0]
+        result = {}
+        for y in range(y0, y1 + 1):
+            row = nodes[y]
+            for x in range(x0, x1 + 1):
+                result.update(row[x])
+        return result
+
+    def candidates(self, sp, rect):
+        """
+        获取可能与精灵发生碰撞的候选精灵
+        :param sp: 精灵
+        :param rect: 精灵的碰撞矩形
+        :return: 候选精灵的集合
+        """
+        return self.query(rect)
+
+
+class SweepAndPrune(object):
+    def __init__(self):
+        """
+        扫描排除法 (sweep and prune) 的碰撞粗检测
+        按碰撞矩形左边沿排序的精灵列表在帧之间保留，每帧只需用插入排序修复
+        """
+        self.items = []  # 按碰撞矩形左边沿排序的精灵
+        self.lefts = []  # 与 items 对应的左边沿，用于二分查找
+        self.boxes = {}  # 精灵 -> (left, top, right, bottom)
+        self.neighbors = {}  # 精灵 -> 碰撞矩形在 x, y 上都有重叠的精灵
+
+    def update(self, sprites, rect_func):
+        """
+        更新所有精灵的碰撞矩形，修复排序并扫描出重叠的精灵对
+        :param sprites: 当前所有的精灵
+        :param rect_func: 计算精灵碰撞矩形的函数
+        :return: None
+        """
+        boxes = self.boxes
+        items = self.items
+        if any(sp not in sprites for sp in items):
+            items[:] = [sp for sp in items if sp in sprites]
+        fresh = {}
+        for sp in sprites:
+            r = rect_func(sp)
+            fresh[sp] = (r.left, r.top, r.right, r.bottom)
+            if sp not in boxes:
+                items.append(sp)
+        self.boxes = boxes = fresh
+
+        # 精灵每帧只移动几个像素，列表几乎有序，插入排序接近 O(n)
+        for i in range(1, len(items)):
+            sp = items[i]
+            left = boxes[sp][0]
+            j = i - 1
+            while j >= 0 and boxes[items[j]][0] > left:
+                items[j + 1] = items[j]
+                j -= 1
+            items[j + 1] = sp
+        self.lefts = [boxes[sp][0] for sp in items]
+
+        neighbors = {}
+        active = []
+        for sp in items:
+            left, top, right, bottom = boxes[sp]
+            active = [a for a in active if boxes[a][2] >= left]
+            for a in active:
+                box = boxes[a]
+                if box[1] <= bottom and top <= box[3]:
+                    neighbors.setdefault(a, {})[sp] = None
+                    neighbors.setdefault(sp, {})[a] = None
+            active.append(sp)
+        self.neighbors = neighbors
+
+    def candidates(self, sp, rect):
+        """
+        获取可能与精灵发生碰撞的候选精灵
+        :param sp: 精灵
+        :param rect: 精灵的碰撞矩形，已在 update 中计算，此处不使用
+        :return: 候选精灵的集合
+        """
+        return self.neighbors.get(sp, ())
+
+    def query(self, rect):
+        """
+        查询碰撞矩形与矩形有重叠（含边沿接触）的精灵
+        :param rect: 矩形
+        :return: 精灵的集合
+        """
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        boxes = self.boxes
+        result = {}
+        for sp in self.items[:bisect.bisect_right(self.lefts, right)]:
+            box = boxes[sp]
+            if box[2] >= left and box[1] <= bottom and top <= box[3]:
+                result[sp] = None
+        return result
+
+
+def sweep_time(start, end, size, target):
+    """
+    计算从 start 移动到 end 的矩形首次与目标矩形相交的时刻（连续碰撞检测）
+    将目标矩形按移动矩形的尺寸扩展后，转化为线段与矩形的相交计算
+    :param start: 移动矩形起点的中心
+    :param end: 移动矩形终点的中心
+    :param size: 移动矩形的尺寸 (宽, 高)
+    :param target: 目标矩形 (left, top, right, bottom)
+    :return: 相交时刻，0~1 之间；None: 不相交
+    """
+    hw, hh = size[0] / 2.0, size[1] / 2.0
+    left, top, right, bottom = target
+    t0, t1 = 0.0, 1.0
+    for p, d, lo, hi in ((start[0], end[0] - start[0], left - hw, right + hw),
+                         (start[1], end[1] - start[1], top - hh, bottom + hh)):
+        if d == 0:
+            if p <= lo or p >= hi:
+                return None
+            continue
+        a = (lo - p) / d
+        b = (hi - p) / d
+        if a > b:
+            a, b = b, a
+        if a > t0:
+            t0 = a
+        if b < t1:
+            t1 = b
+        if t0 >= t1:
+            return None
+    return t0
+
+
+def pack_boxes(sweeps):
+    """
+    将一组精灵的碰撞矩形打包为数组，供 overlap_matrix 使用
+    :param sweeps: [(上次的碰撞矩形, 当前的碰撞矩形, 是否连续检测), ...]
+    :return: numpy 数组，每行为 (left, top, right, bottom, 中心x, 中心y, 上次中心x, 上次中心y, 上次left, 上次top,
+    上次right, 上次bottom, 是否连续检测)
+    """
+    return numpy.array([(r.left, r.top, r.right, r.bottom, r.centerx, r.centery, l.centerx, l.centery,
+                         l.left, l.top, l.right, l.bottom, swept)
+                        for l, r, swept in sweeps], dtype=float).reshape(-1, 13)
+
+
+def overlap_matrix(pa, pb):
+    """
+    一次性计算两组碰撞矩形两两之间是否碰撞，结果与 Rect.colliderect 加上 sweep_time 的逐个计算相同
+    :param pa: pack_boxes 打包的数组a
+    :param pb: pack_boxes 打包的数组b
+    :return: 布尔矩阵，[i, j] 表示 a 中第 i 个与 b 中第 j 个是否碰撞
+    """
+    col = lambda p, i: p[:, i][:, None]
+    row = lambda p, i: p[:, i][None, :]
+    la, ta, ra, ba = (col(pa, i) for i in range(4))
+    lb, tb, rb, bb = (row(pb, i) for i in range(4))
+    hit = (la < rb) & (lb < ra) & (ta < bb) & (tb < ba)
+    hit &= (ra > la) & (ba > ta) & (rb > lb) & (bb > tb)
+    swept = (col(pa, 12) > 0) | (row(pb, 12) > 0)
+    if not swept.any():
+        return hit
+
+    # 以 b 为参照系，a 从上次的中心移动到 (当前中心 - b 的位移)，与 b 上次的矩形求相交时刻
+    t0 = numpy.zeros(hit.shape)
+    t1 = numpy.ones(hit.shape)
+    inside = numpy.ones(hit.shape, dtype=bool)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for c, lo_i, hi_i, size in ((4, 8, 10, col(pa, 2) - col(pa, 0)), (5, 9, 11, col(pa, 3) - col(pa, 1))):
+            p = col(pa, c + 2)
+            d = (col(pa, c) - p) - (row(pb, c) - row(pb, c + 2))
+            lo = row(pb, lo_i) - size / 2.0
+            hi = row(pb, hi_i) + size / 2.0
+            still = d == 0
+            inside &= ~still | ((p > lo) & (p < hi))
+            a = (lo - p) / d
+            b = (hi - p) / d
+            near = numpy.where(still, -numpy.inf, numpy.minimum(a, b))
+            far = numpy.where(still, numpy.inf, numpy.maximum(a, b))
+            t0 = numpy.maximum(t0, near)
+            t1 = numpy.minimum(t1, far)
+    return hit | (swept & inside & (t0 < t1))
+
+
+class QuadTree(object):
+    def __init__(self, bounds, max_items=8, max_depth=8):
+        """
+        四叉树，用于索引不会移动的精灵，只在精灵增减时重建
+        :param bounds: 树覆盖的区域
+        :param max_items: 节点中的精灵超过此数量时进行分裂
+        :param max_depth: 最大深度
+        """
+        self.bounds = pygame.Rect(bounds)
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.items = []  # 本节点中的 (精灵, 矩形)，包括跨越多个子节点的精灵
+        self.children = None
+
+    @classmethod
+    def build(cls, items, bounds=None):
+        """
+        由一组精灵构建四叉树
+        :param items: [(精灵, 矩形), ...]
+        :param bounds: 树覆盖的区域，None: 所有矩形的并集
+        :return: 四叉树
+        """
+        items = list(items)
+        if bounds is None:
+            bounds = pygame.Rect(0, 0, 0, 0)
+        bounds = pygame.Rect(bounds).unionall([r for sp, r in items]) if items else pygame.Rect(bounds)
+        tree = cls(bounds)
+        for sp, rect in items:
+            tree.insert(sp, rect)
+        return tree
+
+    def insert(self, sp, rect, depth=0):
+        """
+        插入精灵
+        :param sp: 精灵
+        :param rect: 精灵的碰撞矩形
+        :param depth: 当前节点的深度
+        :return: None
+        """
+        if self.children is not None:
+            child = self.child_of(rect)
+            if child is not None:
+                child.insert(sp, rect, depth + 1)
+                return
+        self.items.append((sp, rect))
+        if self.children is None and len(self.items) > self.max_items and depth < self.max_depth:
+            self.split(depth)
+
+    def split(self, depth):
+        x, y, w, h = self.bounds
+        hw, hh = w // 2, h // 2
+        if hw == 0 or hh == 0:
+            return
+        self.children = [QuadTree((x, y, hw, hh), self.max_items, self.max_depth),
+                         QuadTree((x + hw, y, w - hw, hh), self.max_items, self.max_depth),
+                         QuadTree((x, y + hh, hw, h - hh), self.max_items, self.max_depth),
+                         QuadTree((x + hw, y + hh, w - hw, h - hh), self.max_items, self.max_depth)]
+        items, self.items = self.items, []
+        for sp, rect in items:
+            self.insert(sp, rect, depth)
+
+    def child_of(self, rect):
+        """
+        查找完全包含矩形的子节点
+        :param rect: 矩形
+        :return: 子节点；None: 矩形跨越多个子节点
+        """
+        for child in self.children:
+            if child.bounds.contains(rect):
+                return child
+        return None
+
+    def query(self, rect, result=None):
+        """
+        查询与矩形有重叠（含边沿接触）的精灵
+        :param rect: 矩形
+        :param result: 保存结果的字典，None: 新建
+        :return: {精灵: None}
+        """
+        if result is None:
+            result = {}
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        for sp, r in self.items:
+            if r.left <= right and left <= r.right and r.top <= bottom and top <= r.bottom:
+                result[sp] = None
+        if self.children is not None:
+            for child in self.children:
+                b = child.bounds
+                if b.left <= right and left <= b.right and b.top <= bottom and top <= b.bottom:
+                    child.query(rect, result)
+        return result
+
+
+class ResponseSolver(object):
+    def __init__(self, capacity=256):
+        """
+        碰撞响应的求解器，收集一帧中的接触，一次性计算每个实体在 x, y 方向上是否受阻挡
+        接触保存在预先分配的列表中，计算过程中不创建 Rect 和 Vector2
+        :param capacity: 预先分配的接触数量，不够时自动扩大
+        """
+        self.first = [None] * capacity  # 受阻挡的实体
+        self.second = [None] * capacity  # 阻挡它的实体
+        self.count = 0
+
+    def add(self, entity, other):
+        """
+        记录一个接触，entity 的移动受 other 的阻挡
+        :param entity: 实体
+        :param other: 与之接触的实体
+        :return: None
+        """
+        n = self.count
+        if n == len(self.first):
+            self.first.extend([None] * n)
+            self.second.extend([None] * n)
+        self.first[n] = entity
+        self.second[n] = other
+        self.count = n + 1
+
+    def resolve(self):
+        """
+        计算所有接触造成的阻挡，结果写入实体的 blocked_x, blocked_y
+        在重叠区域宽大于高时阻挡 y 方向，高大于宽时阻挡 x 方向，且只阻挡朝向对方的移动
+        :return: None
+        """
+        first = self.first
+        second = self.second
+        for i in range(self.count):
+            a = first[i]
+            b = second[i]
+            first[i] = second[i] = None
+            heading = a.heading
+            vx = a.speed * heading.x
+            vy = a.speed * heading.y
+            if vx == 0 and vy == 0:
+                continue
+            r1 = a.overlap_box
+            r2 = b.overlap_box
+            w = min(r1.right, r2.right) - max(r1.left, r2.left)
+            h = min(r1.bottom, r2.bottom) - max(r1.top, r2.top)
+            if w <= 0 or h <= 0 or w == h:
+                continue
+            if w < h:
+                if vx * (r2.centerx - r1.centerx) > 0:
+                    a.blocked_x = True
+            elif vy * (r2.centery - r1.centery) > 0:
+                a.blocked_y = True
+        self.count = 0
+
+    def clear(self):
+        """
+        丢弃所有未处理的接触
+        :return: None
+        """
+        for i in range(self.count):
+            self.first[i] = self.second[i] = None
+        self.count = 0
+
+
+class ContactBuffer(object):
+    def __init__(self):
+        """
+        碰撞事件的缓冲区，检测阶段只收集不重复的接触，检测结束后再按类型统一分发
+        每种接触类型对应一个处理函数，在第一次出现时登记，之后直接查表
+        """
+        self.handlers = []  # 类型序号 -> 处理函数 handler(a, b)
+        self.contacts = []  # 类型序号 -> 本帧该类型的接触 [(a, b), ...]
+        self.kinds = {}  # 类型的键 -> 类型序号
+        self.seen = set()  # 本帧已记录的接触 (类型序号, a, b)
+
+    def kind(self, key):
+        """
+        查询接触类型的序号
+        :param key: 类型的键
+        :return: 序号；None: 未登记
+        """
+        return self.kinds.get(key)
+
+    def register(self, key, handler):
+        """
+        登记一种接触类型
+        :param key: 类型的键
+        :param handler: 处理函数 handler(a, b)
+        :return: 类型序号
+        """
+        kind = self.kinds[key] = len(self.handlers)
+        self.handlers.append(handler)
+        self.contacts.append([])
+        return kind
+
+    def reset(self):
+        """
+        清除所有登记的类型，在碰撞规则改变后调用
+        :return: None
+        """
+        self.handlers = []
+        self.contacts = []
+        self.kinds = {}
+        self.seen.clear()
+
+    def add(self, kind, a, b):
+        """
+        记录一个接触，同一类型中 (a, b) 与 (b, a) 只记录一次
+        :param kind: 类型序号
+        :param a: 精灵a
+        :param b: 精灵b
+        :return: None
+        """
+        seen = self.seen
+        if (kind, a, b) in seen or (kind, b, a) in seen:
+            return
+        seen.add((kind, a, b))
+        self.contacts[kind].append((a, b))
+
+    def dispatch(self):
+        """
+        按类型依次调用处理函数；在之前的处理中已被移除的精灵不再参与后续的接触
+        :return: None
+        """
+        for handler, contacts in zip(self.handlers, self.contacts):
+            for a, b in contacts:
+                if a.alive() and b.alive():
+                    handler(a, b)
+            del contacts[:]
+        self.seen.clear()
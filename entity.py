@@ -2,11 +2,39 @@ import pygame
 from pygame.locals import *
 from pygame import sprite
 from gameobjects.vector2 import Vector2
+import collision
+import assets
+from assets import image_cache, image_key, rotation_cache, frame_table
+from layer import StaticLayer
+from collision import SpatialHash, SweepAndPrune, QuadTree, ResponseSolver, ContactBuffer, scale_rect, sweep_time, pack_boxes, overlap_matrix, mask_cache
 import math
+import bisect
 
 collide_ratio = 0.7
 
 
+def image_scale(size, rc, nums, world_size):
+    """
+    计算图像按世界大小缩放的比例
+    :param size: 图像的尺寸
+    :param rc: 一个元组(m, n)，表示图片是m*n帧的
+    :param nums: 同 Entity 的 nums，None 表示不进行缩放
+    :param world_size: 世界的尺寸
+    :return: 缩放比例
+    """
+    w, h = size  # 获取图片尺寸
+    scale = 1  # 初始化缩放比例为 1
+    if nums is not None:  # 判断 nums 是为None
+        sx = (world_size[0] * rc[0]) / (nums[0] * w)  # 按每行的个数计算缩放比例
+        sy = (world_size[1] * rc[1]) / (nums[1] * h)  # 按每列的个数计算缩放比例
+        # 为了好看，按照原图的长宽比进行缩放，取缩放量小的比例，颜值即是正义
+        if abs(sx - 1) > abs(sy - 1):
+            scale = sy
+        else:
+            scale = sx
+    return scale
+
+
 def rect_edge(heading, size):
     """
     以矩形中心为原点，计算射线于矩形边沿的交点
@@ -52,112 +80,10 @@ def not_overlap(rect, over):
     return Rect(x, y, w, h)
 
 
-def not_overlap_collide(velocity1, rect1, velocity2, rect2):
-    """
-    根据运动速度和矩形计算回退的位移
-    :param velocity1: 矩形 1 的速度
-    :param rect1: 矩形 1
-    :param velocity2: 矩形 2 的速度
-    :param rect2: 矩形 2
-    :return: 两个位移
-    """
-    v1 = Vector2(velocity1)
-    v2 = Vector2(velocity2)
-    r1 = Rect(rect1)
-    c1 = r1.center
-    cr = collide_ratio
-    r1.w *= cr
-    r1.h *= cr
-    r1.center = c1
-    r2 = Rect(rect2)
-    c2 = r2.center
-    r2.w *= cr
-    r2.h *= cr
-    r2.center = c2
-    r = r1.clip(r2)
-    size = r.size
-    p = Vector2(c1) - c2
-    x1 = Vector2()
-    x2 = Vector2(1, 1)
-    if v1.get_length() > 0:
-        delta_x, delta_y = rect_edge(v1, size)
-        x, y = p * v1
-        if x < 0:
-            x1.x = delta_x
-        else:
-            x2.x = 2
-        if y < 0:
-            x1.y = delta_y
-        else:
-            x2.y = 2
-    else:
-        x2 *= 2
-    if v2.get_length() == 0:
-        x2 = Vector2()
-        x1 *= 2
-    else:
-        delta_x, delta_y = rect_edge(v2, size)
-        x, y = p * v2
-        if x > 0:
-            x2.x *= delta_x
-        else:
-            x1.x *= 2
-            x2.x = 0
-        if y > 0:
-            x2.y *= delta_y
-        else:
-            x1.y *= 2
-            x2.y = 0
-    return x1, x2
-
-
-def can_move(v, p, s):
-    """
-    计算x, y分量方向是否可以移动
-    :param v: 速度
-    :param p: 两点之间的位移
-    :param s: 矩形交集的长宽
-    :return: x, y分量上是否可以移动
-    """
-    if v.get_length() > 0:
-        x, y = v * p
-        w, h = s
-        if w == h:
-            r1, r2 = True, True
-        elif w > h:
-            r1, r2 = True, False
-        else:
-            r1, r2 = False, True
-        return r1 if x > 0 else True, r2 if y > 0 else True
-    else:
-        return False, False
-
-
-def collide_can_move_xy(velocity1, rect1, velocity2, rect2):
-    """
-    计算是否可以在x, y方向移动
-    :param velocity1: 矩形1的速度
-    :param rect1: 矩形1
-    :param velocity2: 矩形2的速度
-    :param rect2: 矩形2
-    :return: 两矩形在x, y上是否可以移动；True: 可移动，False: 不可移动
-    """
-    v1 = Vector2(velocity1)
-    v2 = Vector2(velocity2)
-    r1 = Rect(rect1)
-    c1 = r1.center
-    cr = collide_ratio
-    r2 = Rect(rect2)
-    c2 = r2.center
-    r = r1.clip(r2)
-    s = r.size
-    p = Vector2(c1) - c2
-    a = can_move(v1, -p, s)
-    b = can_move(v2, p, s)
-    return a, b
-
-
 class Entity(sprite.Sprite):
+    static = False  # 是否永远不会移动，不会移动的精灵放入静态索引，彼此之间不进行碰撞检测
+    image_version = 0  # 在原图像上直接修改像素时加一，局部重绘据此判断图像是否改变
+
     def __init__(self, world, name, group, position, heading, speed, image, rc=(1, 1), nums=None, angle=0,
                  overlap=(0, False)):
         """
@@ -184,20 +110,30 @@ class Entity(sprite.Sprite):
         self.speed = speed
         self.position = Vector2(position)
         self.master_image = self.load(image, rc, nums)  # 加载图片
+        # 图像的标识，相同文件且相同尺寸的图像共用遮罩等缓存；None: 不缓存
+        self.image_key = (image, self.master_image.get_size()) if isinstance(image, str) else None
+        self.angle = 0  # 当前图像相对于原图旋转的角度
         self.frame_row = 0  # 帧的行号
         self.frame_col = 0  # 真的列号
         self.row_num = rc[0]  # 每行的帧数
         self.col_num = rc[1]  # 每列的帧数
-        w, h = self.master_image.get_size()  # 获取图片的尺寸
-        self.frame_width = w / rc[0]  # 计算每帧的宽度
-        self.frame_height = h / rc[1]  # 计算每帧的高度
+        self.frames = frame_table(self.master_image, tuple(rc), self.image_key)  # 切分好的各帧，同一图片的实例共用
+        if self.image_key is not None and any(g in world.mask_groups for g in self.group):
+            # 进行像素级检测的实体在创建时就生成所有帧的遮罩，碰撞检测时只需查表
+            mask_cache.prepare(self.image_key, self.master_image, self.frames.rects.values())
+        self.frame_width = self.frames.frame_width  # 每帧的宽度
+        self.frame_height = self.frames.frame_height  # 每帧的高度
         self.rect = Rect(0, 0, self.frame_width, self.frame_height)  # 显示的区域大小
-        self.image = self.master_image.subsurface(self.rect)  # 创建显示的区域大小的图像对象
+        self.image = self.frames.frames[(0, 0)]  # 显示的图像
         self.action_counter = 0  # 用于控制移动时动画帧率的时间间隔统计
         self.heading = Vector2(heading)  # 朝向
         self.init_angle = angle
         self.overlap = overlap
-        self.collide_entity = {}
+        self.blocked_x = False  # x 方向的移动是否受阻挡，由 world.solver 计算
+        self.blocked_y = False  # y 方向的移动是否受阻挡
+        self.hitbox = None  # 用于碰撞检测的矩形
+        self.overlap_box = None  # 用于碰撞响应的非覆盖区域矩形
+        self.update_hitbox()
 
     def add_groups(self, group):
         """
@@ -224,23 +160,46 @@ class Entity(sprite.Sprite):
         :return: surface 对象
         """
         if isinstance(image, str):
-            master_image = pygame.image.load(image).convert_alpha()  # 载入图片
+            # 图片文件经过缩放后缓存，同样的图片再次创建实例时不需要读取磁盘
+            key = image_key(image, rc, nums, (self.world.width, self.world.height))
+            return image_cache.get(key, lambda: self.load_file(image, rc, nums))
         elif isinstance(image, pygame.Surface):
             master_image = image
         elif isinstance(image, (tuple, list)):
             master_image = pygame.Surface(image, flags=SRCALPHA, depth=32)
         else:
             master_image = pygame.Surface((1, 1), flags=SRCALPHA, depth=32)
-        w, h = master_image.get_size()  # 获取图片尺寸
-        scale = 1  # 初始化缩放比例为 1
-        if nums is not None:  # 判断 nums 是为None
-            sx = (self.world.width * rc[0]) / (nums[0] * w)  # 按每行的个数计算缩放比例
-            sy = (self.world.height * rc[1]) / (nums[1] * h)  # 按每列的个数计算缩放比例
-            # 为了好看，按照原图的长宽比进行缩放，取缩放量小的比例，颜值即是正义
-            if abs(sx - 1) > abs(sy - 1):
-                scale = sy
-            else:
-                scale = sx
+        return self.scale(master_image, rc, nums)
+
+    def load_file(self, path, rc, nums):
+        """
+        加载图片文件并缩放，图集中有缩放好的图像时直接使用图集
+        :param path: 图片路径
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :param nums: 同 __init__ 的 nums
+        :return: surface 对象
+        """
+        if assets.atlas is not None:
+            image = assets.atlas.get(path, rc, nums, (self.world.width, self.world.height))
+            if image is not None:
+                return image
+        if assets.disk_cache is not None:
+            # 缩放结果由源文件内容和这些参数决定，之前的运行保存过时直接读取
+            params = ('scale', tuple(rc), None if nums is None else tuple(nums), (self.world.width, self.world.height))
+            images = assets.disk_cache.get(path, params,
+                                           lambda: [self.scale(pygame.image.load(path).convert_alpha(), rc, nums)])
+            return images[0]
+        return self.scale(pygame.image.load(path).convert_alpha(), rc, nums)  # 载入图片
+
+    def scale(self, master_image, rc, nums):
+        """
+        按世界的大小缩放图像
+        :param master_image: 图像
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :param nums: 同 __init__ 的 nums
+        :return: surface 对象
+        """
+        scale = image_scale(master_image.get_size(), rc, nums, (self.world.width, self.world.height))
         # 返回缩放和旋转后的图像
         return pygame.transform.rotozoom(master_image, 0, scale)
 
@@ -259,6 +218,15 @@ class Entity(sprite.Sprite):
             if self.action_counter > (1 / 10.0):  # 是否到达更新帧号的时间
                 self.frame_col = (self.frame_col + 1) % self.col_num
                 self.action_counter = 0
+        self.update_hitbox()
+
+    def update_hitbox(self):
+        """
+        根据当前的显示区域重新计算碰撞矩形，每次更新只计算一次，碰撞检测和响应都直接使用
+        :return: None
+        """
+        self.hitbox = scale_rect(self.rect, collide_ratio)
+        self.overlap_box = not_overlap(self.rect, self.overlap[0])
 
     def movement(self, time_passed):
         """
@@ -270,7 +238,44 @@ class Entity(sprite.Sprite):
             x = self.heading.get_normalised() * self.speed * time_passed  # 计算此段时间内移动位移
             self.position += x
         self.collide_process(time_passed)  # 处理之前的碰撞造成的位置影响
-        self.collide_entity.clear()  # 清除与之发生碰撞的物体
+        if self.speed != 0:
+            self.check_bounds()
+
+    def check_bounds(self):
+        """
+        检查碰撞矩形是否超出世界的边界，超出时调用 bounds_callback
+        :return: None
+        """
+        bounds = self.world.bounds
+        if bounds is None:
+            return
+        w, h = self.hitbox.size
+        x, y = self.position
+        if x - w / 2.0 < bounds.left:
+            self.bounds_callback('left', bounds)
+        elif x + w / 2.0 > bounds.right:
+            self.bounds_callback('right', bounds)
+        if y - h / 2.0 < bounds.top:
+            self.bounds_callback('top', bounds)
+        elif y + h / 2.0 > bounds.bottom:
+            self.bounds_callback('bottom', bounds)
+
+    def bounds_callback(self, side, bounds):
+        """
+        超出世界边界时的回调函数，默认将位置限制在边界内
+        :param side: 超出的边界，'left', 'right', 'top', 'bottom'
+        :param bounds: 世界的边界
+        :return: None
+        """
+        w, h = self.hitbox.size
+        if side == 'left':
+            self.position.x = bounds.left + w / 2.0
+        elif side == 'right':
+            self.position.x = bounds.right - w / 2.0
+        elif side == 'top':
+            self.position.y = bounds.top + h / 2.0
+        elif side == 'bottom':
+            self.position.y = bounds.bottom - h / 2.0
 
     def get_heading(self):
         """
@@ -289,30 +294,36 @@ class Entity(sprite.Sprite):
         angle = self.get_heading() - self.init_angle
         return angle
 
-    def rotate(self, angle):
+    def frame_angle(self):
         """
-        用来旋转图像
-        :param angle: 旋转的角度
-        :return: None
+        当前帧需要旋转的角度
+        :return: 角度，角度制
         """
-        self.image = pygame.transform.rotate(self.image, angle)
-        position = self.rect.center
-        self.rect = self.image.get_rect()
-        self.rect.center = position
+        return self.init_angle
 
     def load_frame(self):
         """
-        加载当前帧
+        加载当前帧，从旋转缓存中选取最接近 frame_angle 的图像
         :return: surface 对象
         """
-        # 计算当前帧在图片起始位置
-        x = self.frame_col * self.frame_width
-        y = self.frame_row * self.frame_height
-        rect = (x, y, self.frame_width, self.frame_height)
-        self.image = self.master_image.subsurface(rect)  # 更新图像为当前帧
-        self.rotate(self.init_angle)
+        self.angle = self.frame_angle()
+        # 更新图像为当前帧
+        self.image, size = rotation_cache.get(self.frames, (self.frame_row, self.frame_col), self.angle)
+        position = self.rect.center
+        self.rect.size = size
+        self.rect.center = position
         return self.image
 
+    def get_mask(self):
+        """
+        获取当前图像的像素遮罩，遮罩的中心与显示区域的中心对齐
+        :return: 遮罩
+        """
+        if self.image_key is None:
+            return pygame.mask.from_surface(self.image)
+        frame = self.frames.rects[(self.frame_row, self.frame_col)]
+        return mask_cache.get(self.image_key, self.master_image, frame, self.angle)
+
     def collide_callback(self, group_name, entity):
         """
         碰撞时的回调函数
@@ -320,42 +331,20 @@ class Entity(sprite.Sprite):
         :param entity: 与之发生碰撞的事物
         :return:
         """
-        self.collide_entity.setdefault(group_name, dict())[entity] = None
+        self.world.solver.add(self, entity)
 
     def collide_process(self, time_passed):
         """
-        处理之前的碰撞造成的位置影响
+        处理之前的碰撞造成的位置影响，受阻挡的方向退回移动前的位置
         :param time_passed: 时间间隔
         :return:
         """
-        velocity = self.speed * self.heading
-        if velocity.get_length() > 0:
-            rect1 = not_overlap(self.rect, self.overlap[0])
-            x, y = self.rect.center
-            for sprites in self.collide_entity.values():
-                for sp, cm in sprites.items():
-                    if cm is None:
-                        rect2 = not_overlap(sp.rect, sp.overlap[0])
-                        cm, x2 = collide_can_move_xy(velocity, rect1, sp.heading * sp.speed, rect2)
-                        sp.set_collide_entity_position(self.group, self, x2)
-                    if not cm[0]:
-                        self.position.x = x
-                    if not cm[1]:
-                        self.position.y = y
-
-    def set_collide_entity_position(self, group, entity, position):
-        """
-        设置对发生碰撞的事物位置的影响
-        :param group: 精灵组名
-        :param entity: 影响的实例
-        :param position: 对位置的影响
-        :return: None
-        """
-        if not isinstance(group, (tuple, list, dict)):
-            return
-        for g in group:
-            if g in self.collide_entity:
-                self.collide_entity[g][entity] = position
+        if self.blocked_x:
+            self.position.x = self.rect.centerx
+            self.blocked_x = False
+        if self.blocked_y:
+            self.position.y = self.rect.centery
+            self.blocked_y = False
 
     def set_position(self, position):
         """
@@ -388,19 +377,41 @@ class Bullet(Entity):
         self.damage = damage
         self.adjust_angle()
         self.adjust_position()
+        self.update_hitbox()
 
-    def update(self, time_passed):
-        super(Bullet, self).update(time_passed)
-        self.adjust_angle()
+    def frame_angle(self):
+        return self.get_heading()
 
     def collide_callback(self, group_name, entity):
+        # 未声明组对时所有组两两检测，按组名转到与 bullet_hit、bullet_edge 相同的处理
         if group_name == 'bullets':
             return
+        if group_name == 'edge':
+            self.hit_edge(entity)
+        else:
+            self.hit_target(entity)
+
+    def hit_target(self, role):
+        """
+        击中人物后的处理，由 bullet_hit 调用；未声明组对时也会由其他事物触发
+        :param role: 被击中的人物
+        :return: None
+        """
+        self.kill()
+
+    def hit_edge(self, edge):
+        """
+        碰到边界后的处理，由 bullet_edge 调用
+        :param edge: 边界
+        :return: None
+        """
+        self.kill()
+
+    def bounds_callback(self, side, bounds):
         self.kill()
 
     def adjust_angle(self):
-        angle = self.get_heading() - self.init_angle
-        self.rotate(angle)
+        self.load_frame()
 
     def get_damage(self, entity):
         """
@@ -445,6 +456,8 @@ class Role(Entity):
         self.hp_color = hp_color
         self.bullet = {}
         self.move_speed = speed
+        self.canvas = None  # 合成血条和当前帧的图像，重复使用
+        self.canvas_state = None  # 合成时的 (帧, 血量)
 
     def move(self, direction):
         """
@@ -510,20 +523,33 @@ class Role(Entity):
             self.kill()
         return self.hp
 
-    def update(self, time_passed):
-        super(Role, self).update(time_passed)
+    def load_frame(self):
+        """
+        加载当前帧，并在顶部绘制血条
+        :return: surface 对象
+        """
+        frame = super(Role, self).load_frame()
         if self.hp_color is None:
-            return
-        surface = pygame.Surface((self.rect.width, self.rect.height), flags=SRCALPHA, depth=32)
+            return self.image
+        size = self.rect.size
         self.rect.height *= 1.1
-        h = self.rect.height - self.frame_height
-        surface.fill((255, 255, 255), (0, 0, self.rect.width, h))
-        surface.fill(self.hp_color, (0, 0, int(self.rect.width * self.hp / self.max_hp), h))
-        surface.blit(self.image, (0, h))
-        self.image = surface
-        self.rect.center = self.position
+        # 帧和血量都没有变化时直接使用上次合成的图像
+        if self.canvas_state is None or self.canvas_state[0] is not frame or self.canvas_state[1] != self.hp:
+            if self.canvas is None or self.canvas.get_size() != size:
+                self.canvas = pygame.Surface(size, flags=SRCALPHA, depth=32)
+            surface = self.canvas
+            surface.fill((0, 0, 0, 0))
+            h = self.rect.height - self.frame_height
+            surface.fill((255, 255, 255), (0, 0, self.rect.width, h))
+            surface.fill(self.hp_color, (0, 0, int(self.rect.width * self.hp / self.max_hp), h))
+            surface.blit(frame, (0, h))
+            self.canvas_state = (frame, self.hp)
+            self.image_version += 1
+        self.image = self.canvas
+        return self.image
 
     def collide_callback(self, group_name, entity):
+        # 未声明组对时所有组两两检测，子弹的伤害在这里计算；声明了组对时由 bullet_hit 计算
         if group_name == 'bullets':
             self.hit(entity.get_damage(self))
         else:
@@ -557,39 +583,166 @@ class Role(Entity):
             self.bullet.pop(name)
 
 
+def bullet_hit(role, bullet):
+    """
+    人物与子弹接触的处理函数，用于 collide_pair
+    :param role: 人物
+    :param bullet: 子弹
+    :return: None
+    """
+    role.hit(bullet.get_damage(role))
+    bullet.hit_target(role)
+
+
+def bullet_edge(bullet, edge):
+    """
+    子弹与边界接触的处理函数，用于 collide_pair
+    :param bullet: 子弹
+    :param edge: 边界
+    :return: None
+    """
+    bullet.hit_edge(edge)
+
+
 class Obstacle(Entity):
+    static = True
+
     def __init__(self, world, name, position, image, group='obstacle', rc=(1, 1),
                  num=None, angle=0, overlap=(0, False)):
         super(Obstacle, self).__init__(world, name, group, position, (0, 0), 0, image, rc, num, angle, overlap)
+        # 障碍物不会移动，创建时就放到所在的位置，以便建立静态索引
+        self.rect.center = self.position
+        self.update_hitbox()
 
 
 class ListGroup(sprite.Group):
+    resort_ratio = 0.25  # 排序键改变的精灵超过此比例时整体重新排序，否则逐个插入
+
     def __init__(self, *sprites):
+        self.sort = None  # 排序键函数，排序键只能依赖于精灵的 rect 和不会改变的属性
+        self.hidden = {}  # 不绘制的精灵，如已合成到静态层中的精灵
+        self.states = {}  # 精灵 -> (计算排序键时的 rect, 排序键, 加入的顺序)
+        self.entries = []  # 排序后的 (排序键, 加入的顺序, 精灵)
+        self.ordered = None  # 排序后的精灵列表，None: 需要重新整理
+        self.sorted_by = None  # 计算 states 中排序键的函数
+        self.counter = 0
         super(ListGroup, self).__init__(*sprites)
-        self.sort = None
+
+    def add_internal(self, sp, *args):
+        super(ListGroup, self).add_internal(sp, *args)
+        self.states[sp] = (None, None, self.counter)
+        self.counter += 1
+        self.ordered = None
+
+    def remove_internal(self, sp, *args):
+        super(ListGroup, self).remove_internal(sp, *args)
+        self.states.pop(sp, None)
+        self.ordered = None
 
     def sprites(self):
         """
         重写此方法，会返回一个进行排序后的列表
+        缓存每个精灵的排序键，只重新计算 rect 改变的精灵，并只将这些精灵插入到新的位置；
+        排序键相同时按加入的顺序排列，结果与每次整体排序一致
+        返回的列表在下次改变前会被重复使用，调用者不能修改
+        :return: 精灵列表
+        """
+        key = self.sort
+        if not callable(key):
+            return list(self.spritedict)
+        states = self.states
+        if key is not self.sorted_by:
+            self.sorted_by = key
+            for sp, (rect, k, seq) in list(states.items()):
+                states[sp] = (None, None, seq)
+        changed = [sp for sp, state in states.items() if state[0] != sp.rect]
+        if not changed and self.ordered is not None:
+            return self.ordered
+        for sp in changed:
+            states[sp] = (Rect(sp.rect), key(sp), states[sp][2])
+
+        if not self.entries or len(changed) > len(states) * self.resort_ratio:
+            entries = sorted((k, seq, sp) for sp, (rect, k, seq) in states.items())
+        else:
+            moved = set(changed)
+            entries = [e for e in self.entries if e[2] in states and e[2] not in moved]
+            for sp in changed:
+                rect, k, seq = states[sp]
+                bisect.insort(entries, (k, seq, sp))
+        self.entries = entries
+        self.ordered = [e[2] for e in entries]
+        return self.ordered
+
+    def visible(self):
+        """
+        需要绘制的精灵，跳过 hidden 中的精灵
+        :return: 排序后的精灵列表
+        """
+        hidden = self.hidden
+        return [sp for sp in self.sprites() if sp not in hidden] if hidden else self.sprites()
+
+    def draw(self, surface):
+        """
+        重写此方法，跳过 hidden 中的精灵
+        :param surface: 目标图像
         :return: 精灵列表
         """
-        sprites = list(self.spritedict)
-        if callable(self.sort):
-            sprites.sort(key=self.sort)
+        sprites = self.visible()
+        self.spritedict.update(zip(sprites, surface.blits([(sp.image, sp.rect) for sp in sprites])))
+        self.lostsprites = []
         return sprites
 
 
 class WorldBase(object):
-    def __init__(self, surface):
+    batch_threshold = 256  # 两组精灵数量的乘积达到此值时才批量计算，数量少时 numpy 的开销反而更大
+
+    def __init__(self, surface, broadphase='grid', cell_size=64, swept_groups=(), mask_groups=(), bounds=False,
+                 dirty_rects=False):
         """
         世界基类的构造函数
         :param surface: 窗口图像对象
+        :param broadphase: 碰撞粗检测的方式，'grid': 空间哈希；'sap': 扫描排除法；None: 所有精灵两两检测
+        :param cell_size: 空间哈希格子的边长
+        :param swept_groups: 进行连续碰撞检测的组名，这些组的精灵按两次检测之间扫过的区域计算碰撞，
+        低帧率下高速的精灵不会穿过其他物体
+        :param mask_groups: 进行像素级碰撞检测的组名，矩形相交后再比较图像的像素遮罩
+        :param bounds: 是否在移动时直接检查世界的边界，超出边界的实体调用 bounds_callback
+        :param dirty_rects: 是否局部重绘，只擦除和重绘改变的区域，改变的区域保存在 dirty 中，
+        用 pygame.display.update(world.dirty) 只更新这些区域；需要静态层，未设置时使用黑色背景
         """
         self.surface = surface
         self.all_sprite = ListGroup()
         self.all_sprite.sort = self.sort
         self.groups = {}
         self.width, self.height = self.surface.get_size()
+        self.bounds = Rect(0, 0, self.width, self.height) if bounds else None
+        self.collide_matrix = None  # 需要进行碰撞检测的组对，None: 所有组两两检测
+        self.swept_groups = swept_groups
+        self.mask_groups = mask_groups
+        self.last_hitbox = {}  # 连续碰撞检测的精灵在上次检测时的碰撞矩形
+        self.sweeps = {}  # 连续碰撞检测的精灵 -> (上次的碰撞矩形, 当前的碰撞矩形)
+        self.statics = {}  # 不会移动的精灵
+        self.static_index = None  # 不会移动的精灵的四叉树索引，精灵增减后重建
+        self.static_hits = {}  # 本帧中移动的精灵与不会移动的精灵之间的候选，双向记录
+        self.contacts = ContactBuffer()  # 碰撞事件的缓冲区
+        self.solver = ResponseSolver()  # 碰撞响应的求解器
+        self.packed = {}  # 本帧已打包的精灵组，组名 -> (精灵列表, 碰撞矩形数组)
+        self.order = {}  # 精灵加入世界的顺序，用于保持与逐个检测相同的回调顺序
+        self.order_counter = 0
+        self.layer = None  # 静态层，None: 不使用
+        self.dirty_rects = dirty_rects
+        self.dirty = []  # 局部重绘时本帧改变的区域
+        self.drawn = {}  # 局部重绘时上一帧绘制的精灵 -> (图像, 区域, 图像版本)
+        self.invalidated = None  # 下一帧需要额外重绘的区域，None: 全部重绘
+        self.overlays = []  # 绘制在所有精灵之上的精灵组，如抬头显示
+        if broadphase == 'grid':
+            self.broadphase = SpatialHash(self.width, self.height, cell_size)
+        elif broadphase == 'sap':
+            self.broadphase = SweepAndPrune()
+        elif broadphase is None:
+            self.broadphase = None
+        else:
+            raise ValueError("Unknown broadphase")
 
     def add(self, group_name, *sprites):
         """
@@ -600,6 +753,15 @@ class WorldBase(object):
         """
         self.all_sprite.add(*sprites)
         self.groups.setdefault(group_name, sprite.Group()).add(*sprites)
+        for sp in sprites:
+            if sp not in self.order:
+                self.order[sp] = self.order_counter
+                self.order_counter += 1
+            if getattr(sp, 'static', False) and sp not in self.statics:
+                self.statics[sp] = None
+                self.static_index = None
+                if self.layer is not None:
+                    self.bake(sp)
 
     def remove(self, group_name, *sprites):
         """
@@ -622,6 +784,56 @@ class WorldBase(object):
             return self.all_sprite
         return self.groups.setdefault(group_name, sprite.Group())
 
+    def collide_pair(self, group_a, group_b, callback=None, batch=False):
+        """
+        声明两个精灵组之间需要进行碰撞检测，未声明的组对不会进行检测
+        :param group_a: 组名a
+        :param group_b: 组名b
+        :param callback: 碰撞时调用的函数 callback(a, b)，a 属于 group_a，b 属于 group_b；
+        None: 调用双方的 collide_callback
+        :param batch: 是否使用 numpy 一次性计算两组之间的碰撞，适用于数量多的组对；未安装 numpy 时忽略
+        :return: None
+        """
+        if self.collide_matrix is None:
+            self.collide_matrix = {}
+        # 声明时就登记接触类型和处理函数，分发时直接查表
+        kind = self.contacts.register((group_a, group_b), self.contact_handler(group_a, group_b, callback))
+        self.collide_matrix[(group_a, group_b)] = (kind, False, batch)
+        if group_a != group_b:
+            self.collide_matrix[(group_b, group_a)] = (kind, True, batch)
+
+    @staticmethod
+    def contact_handler(group_a, group_b, callback=None):
+        """
+        生成接触的处理函数
+        :param group_a: 组名a
+        :param group_b: 组名b
+        :param callback: 处理函数 callback(a, b)；None: 调用双方的 collide_callback
+        :return: 处理函数 handler(a, b)，a 属于 group_a，b 属于 group_b
+        """
+        if callback is not None:
+            return callback
+
+        def handler(a, b):
+            a.collide_callback(group_b, b)
+            b.collide_callback(group_a, a)
+        return handler
+
+    def collide_rule(self, name1, name2):
+        """
+        查询两个精灵组之间的碰撞规则
+        :param name1: 组名1
+        :param name2: 组名2
+        :return: (接触类型, 是否需要交换参数, 是否批量计算)；None: 不进行检测
+        """
+        if self.collide_matrix is None:
+            # 未声明任何组对时所有组两两检测，组对第一次出现时登记默认的处理函数
+            kind = self.contacts.kind((name1, name2))
+            if kind is None:
+                kind = self.contacts.register((name1, name2), self.contact_handler(name1, name2))
+            return kind, False, False
+        return self.collide_matrix.get((name1, name2))
+
     def get_groups(self):
         """
         获取所有精灵组
@@ -629,8 +841,7 @@ class WorldBase(object):
         """
         return self.groups.items()
 
-    @staticmethod
-    def collide(a, b):
+    def collide(self, a, b):
         """
         碰撞计算
         :param a: 精灵a
@@ -639,7 +850,71 @@ class WorldBase(object):
         """
         if a == b:
             return False
-        return sprite.collide_rect_ratio(collide_ratio)(a, b)
+        if a.hitbox.colliderect(b.hitbox):
+            return self.collide_mask(a, b)
+        sweeps = self.sweeps
+        if a in sweeps or b in sweeps:
+            return self.collide_swept(a, b)
+        return False
+
+    def masked(self, sp):
+        """
+        精灵是否需要进行像素级碰撞检测
+        :param sp: 精灵
+        :return: bool
+        """
+        groups = self.mask_groups
+        return bool(groups) and any(g in groups for g in sp.group)
+
+    def mask_of(self, sp):
+        """
+        获取精灵用于像素级碰撞检测的遮罩及其左上角的位置，未开启像素检测的精灵使用填满碰撞矩形的遮罩
+        :param sp: 精灵
+        :return: (遮罩, (x, y))
+        """
+        if self.masked(sp):
+            mask = sp.get_mask()
+            w, h = mask.get_size()
+            x, y = sp.rect.center
+            return mask, (x - w // 2, y - h // 2)
+        return mask_cache.solid(sp.hitbox.size), sp.hitbox.topleft
+
+    def collide_mask(self, a, b):
+        """
+        像素级碰撞计算，只在矩形已经相交后调用
+        :param a: 精灵a
+        :param b: 精灵b
+        :return: 是否发生碰撞
+        """
+        if not (self.masked(a) or self.masked(b)):
+            return True
+        ma, (ax, ay) = self.mask_of(a)
+        mb, (bx, by) = self.mask_of(b)
+        return ma.overlap(mb, (bx - ax, by - ay)) is not None
+
+    def collide_swept(self, a, b):
+        """
+        连续碰撞计算，以 b 为参照系，计算 a 在两次检测之间扫过的区域是否与 b 相交
+        :param a: 精灵a
+        :param b: 精灵b
+        :return: 是否发生碰撞
+        """
+        a0, a1 = self.sweeps.get(a) or (self.hitbox(a),) * 2
+        b0, b1 = self.sweeps.get(b) or (self.hitbox(b),) * 2
+        bx, by = b1.centerx - b0.centerx, b1.centery - b0.centery
+        end = a1.centerx - bx, a1.centery - by
+        return sweep_time(a0.center, end, a1.size, (b0.left, b0.top, b0.right, b0.bottom)) is not None
+
+    def collide_box(self, sp):
+        """
+        计算精灵在粗检测中占据的矩形，连续碰撞检测的精灵为两次检测之间扫过的区域
+        :param sp: 精灵
+        :return: 矩形
+        """
+        sweep = self.sweeps.get(sp)
+        if sweep is None:
+            return self.hitbox(sp)
+        return sweep[0].union(sweep[1])
 
     @staticmethod
     def sort(sp):
@@ -660,28 +935,390 @@ class WorldBase(object):
             y = -y
         return y
 
+    @staticmethod
+    def hitbox(sp):
+        """
+        获取精灵用于碰撞检测的矩形
+        :param sp: 精灵
+        :return: 矩形
+        """
+        return sp.hitbox
+
+    def groupcollide(self, group1, group2):
+        """
+        借助粗检测计算两个精灵组之间的碰撞，结果及其顺序与 sprite.groupcollide 相同
+        :param group1: 精灵组1
+        :param group2: 精灵组2
+        :return: {精灵a: [与之碰撞的精灵b, ...]}
+        """
+        statics = self.statics
+        if self.broadphase is None:
+            collide = self.collide
+
+            def collided(a, b):
+                # 不会移动的精灵之间不进行检测
+                return not (a in statics and b in statics) and collide(a, b)
+            return sprite.groupcollide(group1, group2, False, False, collided)
+        crashed = {}
+        members = group2.spritedict
+        order = self.order.__getitem__
+        collide = self.collide
+        static_hits = self.static_hits
+        for a in group1.sprites():
+            if a in statics:
+                candidates = static_hits.get(a, ())
+            else:
+                candidates = self.broadphase.candidates(a, self.collide_box(a))
+                if a in static_hits:
+                    candidates = list(candidates) + list(static_hits[a])
+            bs = [b for b in candidates if b in members]
+            if not bs:
+                continue
+            bs.sort(key=order)
+            bs = [b for b in bs if collide(a, b)]
+            if bs:
+                crashed[a] = bs
+        return crashed
+
+    def pack(self, group_name):
+        """
+        将精灵组的碰撞矩形打包为数组，每帧每组只打包一次
+        :param group_name: 组名
+        :return: (精灵列表, 碰撞矩形数组)
+        """
+        packed = self.packed.get(group_name)
+        if packed is None:
+            sprites = self.group(group_name).sprites()
+            sweeps = self.sweeps
+            boxes = []
+            for sp in sprites:
+                sweep = sweeps.get(sp)
+                if sweep is None:
+                    rect = self.hitbox(sp)
+                    boxes.append((rect, rect, False))
+                else:
+                    boxes.append((sweep[0], sweep[1], True))
+            packed = self.packed[group_name] = (sprites, pack_boxes(boxes))
+        return packed
+
+    def groupcollide_batch(self, name1, name2):
+        """
+        使用 numpy 一次性计算两个精灵组之间的碰撞，结果及其顺序与 groupcollide 相同
+        :param name1: 组名1
+        :param name2: 组名2
+        :return: {精灵a: [与之碰撞的精灵b, ...]}
+        """
+        sa, pa = self.pack(name1)
+        sb, pb = self.pack(name2)
+        crashed = {}
+        if not sa or not sb:
+            return crashed
+        hit = overlap_matrix(pa, pb)
+        if name1 == name2:
+            collision.numpy.fill_diagonal(hit, False)
+        # 之前的组对中被移除的精灵不再参与计算
+        ma = self.group(name1).spritedict
+        mb = self.group(name2).spritedict
+        masked = name1 in self.mask_groups or name2 in self.mask_groups
+        statics = self.statics
+        for i, j in zip(*hit.nonzero()):
+            a, b = sa[i], sb[j]
+            if a not in ma or b not in mb or (a in statics and b in statics):
+                continue
+            if masked and a.hitbox.colliderect(b.hitbox) and not self.collide_mask(a, b):
+                continue
+            crashed.setdefault(a, []).append(b)
+        return crashed
+
+    def update_static_index(self):
+        """
+        在需要时重建不会移动的精灵的索引，并查询每个移动的精灵附近不会移动的精灵
+        :return: None
+        """
+        if self.static_index is None:
+            self.static_index = QuadTree.build(((sp, self.hitbox(sp)) for sp in self.statics),
+                                               (0, 0, self.width, self.height))
+        static_hits = {}
+        if self.statics:
+            index = self.static_index
+            for sp in self.all_sprite.spritedict:
+                if sp in self.statics:
+                    continue
+                hits = index.query(self.collide_box(sp))
+                if hits:
+                    static_hits[sp] = hits
+                    for s in hits:
+                        static_hits.setdefault(s, {})[sp] = None
+        self.static_hits = static_hits
+
     def process(self):
         """
         处理函数，进行精灵碰撞等计算
         :return:
         """
+        sweeps = {}
+        for name in self.swept_groups:
+            for sp in self.group(name):
+                rect = self.hitbox(sp)
+                sweeps[sp] = (self.last_hitbox.get(sp, rect), rect)
+        self.sweeps = sweeps
+        self.packed = {}
+        self.last_hitbox = dict((sp, rect) for sp, (last, rect) in sweeps.items())
+        # 移除已不在世界中的精灵的记录，与是否使用粗检测无关
+        alive = self.all_sprite.spritedict
+        for sp in [sp for sp in self.order if sp not in alive]:
+            self.order.pop(sp)
+            if sp in self.statics:
+                self.statics.pop(sp)
+                self.static_index = None
+        if self.broadphase is not None:
+            self.update_static_index()
+            dynamic = dict((sp, None) for sp in alive if sp not in self.statics)
+            self.broadphase.update(dynamic, self.collide_box)
+        contacts = self.contacts
         groups = list(self.groups.items())
         for group in groups[:]:
             name1, group1 = group
             for name2, group2 in groups:
-                g = sprite.groupcollide(group1, group2, False, False, self.collide)
+                rule = self.collide_rule(name1, name2)
+                if rule is None:
+                    continue
+                kind, swap, batch = rule
+                if batch and collision.numpy is not None and \
+                        len(group1) * len(group2) >= self.batch_threshold:
+                    g = self.groupcollide_batch(name1, name2)
+                else:
+                    g = self.groupcollide(group1, group2)
                 for a, bs in g.items():
                     for b in bs:
-                        a.collide_callback(name2, b)
-                        b.collide_callback(name1, a)
+                        if swap:
+                            contacts.add(kind, b, a)
+                        else:
+                            contacts.add(kind, a, b)
             groups.remove(group)
+        # 所有检测结束后再分发碰撞事件，回调中移除精灵不会影响检测过程
+        contacts.dispatch()
         return None
 
+    def query_rect(self, rect, group_name=None):
+        """
+        查询碰撞矩形与矩形相交的精灵，借助碰撞检测使用的索引，索引在每次 process 时更新
+        :param rect: 矩形
+        :param group_name: 只查询此组的精灵，None: 所有精灵
+        :return: 精灵列表，按加入世界的顺序排列
+        """
+        rect = Rect(rect)
+        if group_name is None:
+            members = self.all_sprite.spritedict
+        else:
+            members = self.group(group_name).spritedict
+        if self.broadphase is None:
+            candidates = members
+        else:
+            candidates = dict(self.broadphase.query(rect))
+            if self.static_index is not None:
+                self.static_index.query(rect, candidates)
+        result = [sp for sp in candidates if sp in members and sp.hitbox.colliderect(rect)]
+        if self.broadphase is not None:
+            order = self.order
+            result.sort(key=lambda sp: order.get(sp, -1))
+        return result
+
+    def query_radius(self, center, radius, group_name=None):
+        """
+        查询碰撞矩形与圆相交的精灵
+        :param center: 圆心
+        :param radius: 半径
+        :param group_name: 只查询此组的精灵，None: 所有精灵
+        :return: 精灵列表，按加入世界的顺序排列
+        """
+        x, y = center
+        rect = Rect(x - radius, y - radius, radius * 2 + 1, radius * 2 + 1)
+        result = []
+        for sp in self.query_rect(rect, group_name):
+            box = sp.hitbox
+            dx = max(box.left - x, 0, x - box.right)
+            dy = max(box.top - y, 0, y - box.bottom)
+            if dx * dx + dy * dy <= radius * radius:
+                result.append(sp)
+        return result
+
+    def nearest(self, position, k=1, group_name=None, exclude=None):
+        """
+        查询距离某点最近的 k 个精灵，从小范围开始查询，不够时扩大范围
+        :param position: 位置
+        :param k: 数量
+        :param group_name: 只查询此组的精灵，None: 所有精灵
+        :param exclude: 不包括的精灵，通常是查询者自己
+        :return: 精灵列表，按距离从近到远排列
+        """
+        x, y = position
+        radius = getattr(self.broadphase, 'cell_size', 64)
+        limit = max(self.width, self.height) * 2
+        while True:
+            found = []
+            for sp in self.query_rect((x - radius, y - radius, radius * 2 + 1, radius * 2 + 1), group_name):
+                if sp is exclude:
+                    continue
+                d = sp.position.get_distance_to((x, y))
+                if d <= radius:
+                    found.append((d, sp))
+            if len(found) >= k or radius >= limit:
+                found.sort(key=lambda item: item[0])
+                return [sp for d, sp in found[:k]]
+            radius *= 2
+
+    def raycast(self, start, end, group_name=None, exclude=None):
+        """
+        查询从起点到终点的线段第一个碰到的精灵，沿线段逐段查询索引
+        :param start: 起点
+        :param end: 终点
+        :param group_name: 只查询此组的精灵，None: 所有精灵
+        :param exclude: 不包括的精灵，通常是射线的发出者
+        :return: (精灵, 交点)；None: 没有碰到任何精灵
+        """
+        start = Vector2(start)
+        end = Vector2(end)
+        length = start.get_distance_to(end)
+        step = getattr(self.broadphase, 'cell_size', 64)
+        n = max(1, int(math.ceil(length / step)))
+        line = (tuple(start), tuple(end))
+        best = None
+        for i in range(n):
+            p0 = start + (end - start) * (i / float(n))
+            p1 = start + (end - start) * ((i + 1) / float(n))
+            x0, x1 = sorted((p0.x, p1.x))
+            y0, y1 = sorted((p0.y, p1.y))
+            for sp in self.query_rect((x0, y0, x1 - x0 + 1, y1 - y0 + 1), group_name):
+                if sp is exclude:
+                    continue
+                clipped = sp.hitbox.clipline(*line)
+                if not clipped:
+                    continue
+                point = clipped[0]
+                d = start.get_distance_to(point)
+                if best is None or d < best[0]:
+                    best = (d, sp, point)
+            # 之后的分段距离更远，本段内已有结果即可返回
+            if best is not None and best[0] <= length * (i + 1) / float(n):
+                return best[1], best[2]
+        if best is not None:
+            return best[1], best[2]
+        return None
+
+    def set_background(self, path=None, tiles=()):
+        """
+        使用静态层绘制背景，背景、图块和不会移动的精灵合成为一张图像，每帧只需绘制一次；
+        合成的精灵总是绘制在移动的精灵下面
+        :param path: 背景图片路径，None: 没有背景
+        :param tiles: (图像, 位置) 的列表，按顺序绘制在背景上
+        :return: StaticLayer
+        """
+        self.layer = StaticLayer((self.width, self.height))
+        if path is not None:
+            self.layer.set_background(path)
+        for image, position in tiles:
+            self.layer.add_tiles(image, position)
+        self.all_sprite.hidden.clear()
+        for sp in self.statics:
+            self.bake(sp)
+        return self.layer
+
+    def bake(self, sp):
+        """
+        将不会移动的精灵合成到静态层中
+        :param sp: 精灵
+        :return: None
+        """
+        self.layer.add_sprite(sp)
+        self.all_sprite.hidden[sp] = None
+
+    def invalidate(self, *rects):
+        """
+        局部重绘时，下一帧额外重绘这些区域，如覆盖在世界上的文字改变时
+        :param rects: 区域；不传入时不做任何事
+        :return: None
+        """
+        if self.invalidated is not None:
+            self.invalidated.extend(Rect(rect) for rect in rects)
+
+    def invalidate_all(self):
+        """
+        局部重绘时，下一帧全部重绘
+        :return: None
+        """
+        self.invalidated = None
+
+    def draw_dirty(self):
+        """
+        局部重绘：位置、图像改变或消失的精灵，擦除新旧区域后按顺序重绘与这些区域相交的精灵
+        :return: 改变的区域列表
+        """
+        if self.layer is None:
+            self.set_background()
+        layer = self.layer
+        surface = self.surface
+        alive = self.all_sprite.spritedict
+        hidden = self.all_sprite.hidden
+        for sp in [sp for sp in hidden if sp not in alive]:
+            hidden.pop(sp)
+        for sp in [sp for sp in layer.sprites if sp not in alive]:
+            layer.remove_sprite(sp)
+        full = layer.surface is None or self.invalidated is None
+        background = layer.surface or layer.render()
+
+        sprites = self.all_sprite.visible()
+        drawn = self.drawn
+        current = {}
+        dirty = [] if full else self.invalidated
+        for sp in sprites:
+            state = current[sp] = (sp.image, Rect(sp.rect), getattr(sp, 'image_version', 0))
+            last = drawn.pop(sp, None)
+            if last is None:
+                dirty.append(state[1])
+            elif last[0] is not state[0] or last[1] != state[1] or last[2] != state[2]:
+                dirty.append(last[1].union(state[1]))
+        dirty.extend(last[1] for last in drawn.values())  # 已消失的精灵
+        self.drawn = current
+        self.invalidated = []
+
+        # 覆盖层与精灵一起参与局部重绘，改变时由使用者调用 invalidate 传入新旧区域
+        sprites = sprites + [sp for group in self.overlays for sp in group.sprites()]
+        bounds = surface.get_rect()
+        if full:
+            surface.blit(background, (0, 0))
+            surface.blits([(sp.image, sp.rect) for sp in sprites])
+            return [bounds]
+        dirty = [rect for rect in (rect.clip(bounds) for rect in dirty) if rect.width and rect.height]
+        if dirty:
+            rects = [Rect(sp.rect) for sp in sprites]
+            clip = surface.get_clip()
+            for rect in dirty:
+                # 限制在区域内绘制，区域外的像素保持不变，半透明的像素不会重复叠加
+                surface.set_clip(rect)
+                surface.blit(background, rect, rect)
+                for i in rect.collidelistall(rects):
+                    surface.blit(sprites[i].image, rects[i])
+            surface.set_clip(clip)
+        return dirty
+
     def update(self, time_pass_second):
         """
         更新，精灵信息并绘画
         :param time_pass_second: 距离上次更新的时间间隔
         :return:
         """
+        self.solver.resolve()
         self.all_sprite.update(time_pass_second)
+        if self.dirty_rects:
+            self.dirty = self.draw_dirty()
+            return
+        if self.layer is not None:
+            alive = self.all_sprite.spritedict
+            hidden = self.all_sprite.hidden
+            for sp in [sp for sp in hidden if sp not in alive]:
+                hidden.pop(sp)
+            self.layer.draw(self.surface, alive)
         self.all_sprite.draw(self.surface)
+        for group in self.overlays:
+            group.draw(self.surface)
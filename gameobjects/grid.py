@@ -1,4 +1,4 @@
-from .locals import WRAP_REPEAT, WRAP_CLAMP, WRAP_ERROR
+from .locals import WRAP_REPEAT, WRAP_CLAMP, WRAP_ERROR, WRAP_NONE
 from .util import saturate
 
 
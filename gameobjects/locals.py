@@ -1,5 +1,4 @@
-
-
 ( WRAP_REPEAT,
   WRAP_CLAMP,
-  WRAP_ERROR ) = list(range(3))
+  WRAP_ERROR,
+  WRAP_NONE ) = list(range(4))
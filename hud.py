@@ -0,0 +1,77 @@
+from pygame.sprite import Sprite, Group
+
+
+class TextWidget(Sprite):
+    def __init__(self, text, value, position, font, color=(255, 0, 0)):
+        """
+        抬头显示的文字，绑定的值改变时才重新渲染，否则直接绘制上次渲染的图像
+        :param text: 格式字符串，如 u"击中：%s"
+        :param value: 返回当前值的函数，无参数
+        :param position: 左上角的位置
+        :param font: pygame.font.Font
+        :param color: 文字颜色
+        """
+        super(TextWidget, self).__init__()
+        self.text = text
+        self.value = value
+        self.position = position
+        self.font = font
+        self.color = color
+        self.last = self  # 上次渲染时的值，初始为一个不可能的值，保证第一次会渲染
+        self.image = None
+        self.rect = None
+        self.update()
+
+    def update(self, *args):
+        """
+        检查绑定的值，改变时重新渲染
+        :return: 是否重新渲染
+        """
+        value = self.value()
+        if value == self.last:
+            return False
+        self.last = value
+        self.image = self.font.render(self.text % (value,), True, self.color)
+        self.rect = self.image.get_rect(topleft=self.position)
+        return True
+
+
+class Hud(Group):
+    def __init__(self, font, color=(255, 0, 0)):
+        """
+        抬头显示，管理多个文字，每帧调用 update 和 draw
+        :param font: 默认字体
+        :param color: 默认颜色
+        """
+        super(Hud, self).__init__()
+        self.font = font
+        self.color = color
+
+    def update(self, *args):
+        """
+        检查所有文字绑定的值，改变时重新渲染
+        :return: 改变的区域列表（新旧区域的并集），局部重绘时需要擦除和更新这些区域
+        """
+        rects = []
+        for widget in self.sprites():
+            rect = widget.rect
+            if widget.update(*args):
+                rects.append(rect.union(widget.rect))
+        return rects
+
+    def add_text(self, text, value, position=None, font=None, color=None):
+        """
+        添加文字
+        :param text: 格式字符串
+        :param value: 返回当前值的函数，无参数
+        :param position: 左上角的位置；None: 放在上一个文字的下方
+        :param font: 字体；None: 使用默认字体
+        :param color: 颜色；None: 使用默认颜色
+        :return: TextWidget
+        """
+        if position is None:
+            widgets = self.sprites()
+            position = widgets[-1].rect.bottomleft if widgets else (0, 0)
+        widget = TextWidget(text, value, position, font or self.font, color or self.color)
+        self.add(widget)
+        return widget
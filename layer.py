@@ -0,0 +1,126 @@
+import pygame
+import assets
+from assets import image_cache
+
+
+def display_format(surface, alpha=False):
+    """
+    转换为与窗口相同的像素格式，绘制时无需逐像素转换；没有窗口时原样返回
+    :param surface: 图像
+    :param alpha: 是否保留透明通道
+    :return: 图像
+    """
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+
+def background_key(path, size):
+    """
+    背景图片在缓存中的键
+    :param path: 图片路径
+    :param size: 世界的尺寸
+    :return: 键
+    """
+    return path, tuple(size), 'background'
+
+
+def load_background(path, size):
+    """
+    加载背景图片，拉伸到世界的大小并转换为窗口的像素格式，同一图片和大小只处理一次
+    :param path: 图片路径
+    :param size: 世界的尺寸
+    :return: 图像
+    """
+    def factory():
+        image = None
+        if assets.atlas is not None:
+            image = assets.atlas.get(path, (1, 1), None, size, stretch=True)
+        if image is None:
+            image = pygame.transform.scale(pygame.image.load(path), size)
+        return display_format(image)
+
+    return image_cache.get(background_key(path, size), factory)
+
+
+class StaticLayer(object):
+    def __init__(self, size, color=(0, 0, 0)):
+        """
+        静态层，将背景、图块和不会移动的精灵合成为一张图像，每帧只需绘制一次
+        :param size: 尺寸
+        :param color: 没有背景时的底色
+        """
+        self.size = tuple(size)
+        self.color = color
+        self.background = None
+        self.tiles = []  # (图像, 位置)
+        self.sprites = {}  # 合成在静态层中的精灵
+        self.surface = None  # 合成后的图像，None: 需要重新合成
+
+    def set_background(self, path):
+        """
+        设置背景图片
+        :param path: 图片路径
+        :return: None
+        """
+        self.background = load_background(path, self.size)
+        self.surface = None
+
+    def add_tiles(self, surface, position=(0, 0)):
+        """
+        添加一层图块
+        :param surface: 图像
+        :param position: 左上角的位置
+        :return: None
+        """
+        self.tiles.append((surface, position))
+        self.surface = None
+
+    def add_sprite(self, sp):
+        """
+        将不会移动的精灵合成到静态层中
+        :param sp: 精灵
+        :return: None
+        """
+        self.sprites[sp] = None
+        self.surface = None
+
+    def remove_sprite(self, sp):
+        """
+        将精灵从静态层中移除
+        :param sp: 精灵
+        :return: None
+        """
+        if self.sprites.pop(sp, 0) is None:
+            self.surface = None
+
+    def render(self):
+        """
+        合成静态层
+        :return: 合成后的图像
+        """
+        surface = display_format(pygame.Surface(self.size))
+        if self.background is None:
+            surface.fill(self.color)
+        else:
+            surface.blit(self.background, (0, 0))
+        for image, position in self.tiles:
+            surface.blit(image, position)
+        for sp in self.sprites:
+            surface.blit(sp.image, sp.rect)
+        self.surface = surface
+        return surface
+
+    def draw(self, target, alive=None):
+        """
+        绘制静态层，只有一次不透明的绘制
+        :param target: 目标图像
+        :param alive: 存活的精灵，已不存活的精灵从静态层中移除；None: 不检查
+        :return: None
+        """
+        if alive is not None:
+            for sp in [sp for sp in self.sprites if sp not in alive]:
+                self.remove_sprite(sp)
+        if self.surface is None:
+            self.render()
+        target.blit(self.surface, (0, 0))
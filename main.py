@@ -1,5 +1,9 @@
+import assets
 from button import *
 from gameobjects.color import Color
+from hud import Hud
+import media
+from preload import Preloader
 from role import Player
 from world import World
 
@@ -7,7 +11,7 @@ ss = (800, 600)
 
 
 def end_interface(jg, hit_counter, kill_counter):
-    font = pygame.font.Font('font/simfang.ttf', 50)
+    font = assets.font_cache.get(assets.DEFAULT_FONT, 50)
     jz = font.render(u"击中：" + str(hit_counter), True, (255, 0, 0))
     js = font.render(u"击杀：" + str(kill_counter), True, (255, 0, 0))
     jz_x = (ss[0] - jz.get_width()) / 2
@@ -43,11 +47,13 @@ def end_interface(jg, hit_counter, kill_counter):
 
 
 def run(button):
-    wd = World(sc)
+    preloader.finish()  # 等待预加载完成，开始后的第一帧不需要读取磁盘
+    wd = World(sc, dirty_rects=True)  # 局部重绘，只更新改变的区域
     hero = Player(wd)
-    font = pygame.font.Font('font/simfang.ttf', 25)
-    bg = pygame.image.load('media/bg.png').convert()
-    pygame.transform.scale(bg, (wd.width, wd.height))
+    hud = Hud(assets.font_cache.get(assets.DEFAULT_FONT, 25), Color.from_palette('red').rgba8)
+    hud.add_text(u"击中：%d", lambda: wd.hit_counter, (0, 0))
+    wd.overlays.append(hud)  # 抬头显示由世界在精灵之上绘制，参与局部重绘
+    wd.set_background(media.BACKGROUND)  # 背景缩放到世界大小后与不会移动的精灵合成，每帧绘制一次
     while True:
         for e in pygame.event.get():
             if e.type == QUIT:
@@ -63,13 +69,9 @@ def run(button):
 
         tps = clock.tick(30) / 1000
         # sc.fill((255, 255, 255))
-        sc.blit(bg, (0, 0))
-
+        wd.invalidate(*hud.update())  # 文字改变时重绘新旧文字的区域
         wd.update(tps)
-
-        ts = font.render(u"击中：" + str(wd.hit_counter), True, Color.from_palette('red').rgba8)
-        sc.blit(ts, (0, 0))
-        pygame.display.update()
+        pygame.display.update(wd.dirty)
 
 
 def start_interface():
@@ -79,6 +81,7 @@ def start_interface():
     ks = TextButton('开始', position, size, 50, color=Color.from_palette('blue').rgb8,
                     bg=Color.from_palette('black').rgba8, call_back=run)
     bg.add(ks)
+    preloader.start()
 
     while True:
         for e in pygame.event.get():
@@ -88,7 +91,8 @@ def start_interface():
                 if len(bg.clicked(e.pos)) > 0:
                     return
 
-        clock.tick(3)
+        # 预加载未完成时提高帧率，及时将加载好的图片放入缓存
+        clock.tick(30 if preloader.poll() else 3)
         sc.fill((255, 255, 255))
         bg.update()
         bg.draw(sc)
@@ -99,5 +103,11 @@ if __name__ == '__main__':
     pygame.init()
     sc = pygame.display.set_mode(ss, 0, 32)
     pygame.display.set_caption("射击游戏")
+    # 优先使用资源包（python bundle.py 生成），其次使用图集（python atlas.py 生成）
+    if assets.use_bundle('media/assets.bundle') is None:
+        assets.use_atlas('media/atlas')
+    assets.use_disk_cache('.cache')  # 缩放和旋转后的图像保存在磁盘上，之后启动时直接读取
     clock = pygame.time.Clock()
+    preloader = Preloader(ss)
+    assets.font_cache.warm([(assets.DEFAULT_FONT, 25), (assets.DEFAULT_FONT, 50)])  # 界面、抬头显示和结束界面使用的字体
     start_interface()
@@ -0,0 +1,13 @@
+from role import Robot, Player
+from bullet import BounceBullet, SpiralsBullet
+
+BACKGROUND = 'media/bg.png'  # 背景图片，绘制时拉伸到世界的大小
+
+# 游戏中实体使用的图片 (图片路径, rc, nums)，供图集等资源工具预先处理
+SPRITES = [Robot.asset, Player.asset, BounceBullet.asset, SpiralsBullet.asset]
+
+# 进行像素级碰撞检测的实体的图片（World 的 mask_groups），预加载时预先生成遮罩
+MASKED = [BounceBullet.asset, SpiralsBullet.asset]
+
+# 会旋转的实体的图片（子弹按飞行方向旋转），预加载时预先渲染所有角度
+ROTATED = [BounceBullet.asset, SpiralsBullet.asset]
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+import assets
+import media
+from assets import image_cache, image_key, frame_table, rotation_cache
+from collision import mask_cache
+from entity import image_scale
+from layer import background_key, display_format
+
+
+def decode_sprite(path, rc, nums, world_size):
+    """
+    在工作线程中解码并缩放实体图片
+    :return: 缩放后的图像，未转换像素格式
+    """
+    def scale():
+        image = pygame.image.load(path)
+        return [pygame.transform.rotozoom(image, 0, image_scale(image.get_size(), rc, nums, world_size))]
+
+    if assets.disk_cache is not None:
+        # 与 Entity.load_file 使用相同的参数，共用磁盘缓存
+        params = ('scale', tuple(rc), None if nums is None else tuple(nums), tuple(world_size))
+        return assets.disk_cache.get(path, params, scale)[0]
+    return scale()[0]
+
+
+def decode_background(path, size):
+    """
+    在工作线程中解码背景图片并拉伸到世界的大小
+    :return: 拉伸后的图像，未转换像素格式
+    """
+    return pygame.transform.scale(pygame.image.load(path), size)
+
+
+class Preloader(object):
+    def __init__(self, world_size, workers=4):
+        """
+        资源预加载器，在工作线程中解码和缩放图片，主线程只转换像素格式后放入图像缓存，
+        并预先生成像素级碰撞检测使用的遮罩和旋转的图像（开启磁盘缓存时从磁盘读取）
+        :param world_size: 世界的尺寸
+        :param workers: 工作线程数
+        """
+        self.world_size = tuple(world_size)
+        self.workers = workers
+        self.executor = None
+        self.futures = {}  # 缓存的键 -> (Future, (图片路径, rc)；背景为 None)
+        self.masked = set()  # 需要生成遮罩的图片路径
+        self.rotated = set()  # 需要渲染旋转图像的图片路径
+        self.ready = []  # 已放入图像缓存、等待生成遮罩等的 (缓存的键, 图片路径, rc)
+
+    def start(self, sprites=None, background=None, masked=None, rotated=None):
+        """
+        开始预加载，已缓存的图片不再加载，图集或资源包中已有的图片直接放入缓存
+        :param sprites: (图片路径, rc, nums) 的列表，None: media.SPRITES
+        :param background: 背景图片路径，None: media.BACKGROUND
+        :param masked: 需要生成遮罩的 (图片路径, rc, nums) 的列表，None: media.MASKED
+        :param rotated: 需要渲染旋转图像的 (图片路径, rc, nums) 的列表，None: media.ROTATED
+        :return: 加载的数量
+        """
+        if sprites is None:
+            sprites = media.SPRITES
+        if background is None:
+            background = media.BACKGROUND
+        if masked is None:
+            masked = media.MASKED
+        if rotated is None:
+            rotated = media.ROTATED
+        self.masked.update(path for path, rc, nums in masked)
+        self.rotated.update(path for path, rc, nums in rotated)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers)
+        size = self.world_size
+        for path, rc, nums in sprites:
+            key = image_key(path, rc, nums, size)
+            if key in image_cache:
+                self.ready.append((key, path, rc))
+                continue
+            if key in self.futures:
+                continue
+            image = assets.atlas.get(path, rc, nums, size) if assets.atlas is not None else None
+            if image is not None:
+                image_cache.put(key, image)
+                self.ready.append((key, path, rc))
+                continue
+            self.futures[key] = (self.executor.submit(decode_sprite, path, rc, nums, size), (path, rc))
+        key = background_key(background, size)
+        if key not in image_cache and key not in self.futures and \
+                (assets.atlas is None or assets.atlas.entry(background, (1, 1), None, size, True) is None):
+            self.futures[key] = (self.executor.submit(decode_background, background, size), None)
+        return len(self.futures)
+
+    def poll(self):
+        """
+        将已完成的图片转换像素格式后放入图像缓存，并生成遮罩，在主线程中调用
+        加载失败的图片不放入缓存，使用时按原来的方式加载并报告错误
+        :return: 未完成的数量
+        """
+        for key, (future, spec) in list(self.futures.items()):
+            if not future.done():
+                continue
+            self.futures.pop(key)
+            if future.exception() is None:
+                image_cache.put(key, display_format(future.result(), spec is not None))
+                if spec is not None:
+                    self.ready.append((key,) + spec)
+        ready, self.ready = self.ready, []
+        for key, path, rc in ready:
+            self.warm(key, path, rc)
+        if not self.futures and self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        return len(self.futures)
+
+    def warm(self, key, path, rc):
+        """
+        为缓存中的图片生成派生的缓存，与实体使用相同的帧表和遮罩的键
+        :param key: 图像缓存的键
+        :param path: 图片路径
+        :param rc: 一个元组(m, n)，表示图片是m*n帧的
+        :return: None
+        """
+        image = image_cache.images.get(key)
+        if image is None or (path not in self.masked and path not in self.rotated):
+            return
+        image_id = (path, image.get_size())
+        table = frame_table(image, tuple(rc), image_id)
+        if path in self.masked:
+            mask_cache.prepare(image_id, image, table.rects.values())
+        if path in self.rotated:
+            # 取第一个非零的角度，渲染（或从磁盘读取）该帧所有角度的图像
+            for frame in table.frames:
+                rotation_cache.get(table, frame, 360.0 / rotation_cache.steps)
+
+    def finish(self):
+        """
+        等待所有图片加载完成
+        :return: None
+        """
+        for future, spec in list(self.futures.values()):
+            future.exception()  # 等待完成，不抛出异常
+        self.poll()
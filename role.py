@@ -7,13 +7,15 @@ from bullet import *
 
 class Robot(Role):
     counter = 0
+    asset = ('media/hero-0.png', (4, 4), (25, 12.5))  # (图片路径, rc, nums)
 
     def __init__(self, world):
         w = world.width
         h = int(world.height * 0.3)
         position = (random.randint(0, w), random.randint(0, h))
-        super(Robot, self).__init__(world, 'Robot', 'robot', position, (0, -1), 50, 'media/hero-0.png',
-                                    (4, 4), (25, 12.5), hp_color=(255, 0, 0))
+        image, rc, nums = self.asset
+        super(Robot, self).__init__(world, 'Robot', 'robot', position, (0, -1), 50, image,
+                                    rc, nums, hp_color=(255, 0, 0))
         Robot.counter += 1
         self.move_counter = 0
         self.next_time = 0
@@ -48,9 +50,12 @@ class Robot(Role):
 
 
 class Player(Role):
+    asset = ('media/hero-1.png', (4, 4), (25, 12.5))
+
     def __init__(self, world):
-        super(Player, self).__init__(world, 'player', 'player', (400, 300), (0, -1), 50, 'media/hero-1.png',
-                                     (4, 4), (25, 12.5), hp_color=(0, 255, 0))
+        image, rc, nums = self.asset
+        super(Player, self).__init__(world, 'player', 'player', (400, 300), (0, -1), 50, image,
+                                     rc, nums, hp_color=(0, 255, 0))
         self.frame_row = 3
         self.add_bullet('bounce', BounceBullet)
         self.add_bullet('spirals', SpiralsBullet)
@@ -0,0 +1,78 @@
+import unittest
+
+import pygame
+
+import assets
+from assets import Bundle, memory, image_cache, rotation_cache, frame_table, FrameTable
+from collision import mask_cache
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def tearDown(self):
+        assets.atlas = None
+        memory.set_budget(None)
+        image_cache.clear()
+        rotation_cache.clear()
+        mask_cache.clear()
+
+    def sheet(self, size=(40, 30)):
+        surface = pygame.Surface(size, pygame.SRCALPHA)
+        surface.fill((255, 0, 0, 255), (5, 5, size[0] - 10, size[1] - 10))
+        return surface
+
+    def test_oversized_entry_is_kept(self):
+        # 超过预算的缓存项不会在记录时立即被丢弃
+        loads = []
+
+        def load():
+            loads.append(1)
+            return self.sheet()
+
+        memory.set_budget(1)
+        image = image_cache.get(('a.png',), load)
+        self.assertIs(image_cache.get(('a.png',), load), image)
+        self.assertEqual(len(loads), 1)
+
+    def test_evicted_image_in_use_is_not_reloaded(self):
+        # 被丢弃但仍被使用的图像放回缓存，帧表也继续共用
+        memory.set_budget(1)
+        image = image_cache.get(('a.png',), self.sheet)
+        table = frame_table(image, (1, 1), ('a.png', (40, 30)))
+        image_cache.get(('b.png',), self.sheet)
+        self.assertNotIn(('a.png',), image_cache)
+        self.assertIs(image_cache.get(('a.png',), self.fail), image)
+        self.assertIs(frame_table(image, (1, 1), ('a.png', (40, 30))), table)
+
+    def test_rotation_without_rebuilds(self):
+        # 所有分级超过预算时只渲染用到的分级，反复使用时不重新渲染
+        table = FrameTable(self.sheet(), (1, 1))
+        memory.set_budget(rotation_cache.estimate(table.frames[(0, 0)]) // 4)
+        first = [rotation_cache.get(table, (0, 0), angle)[0] for angle in (30, 90, 200)]
+        evictions = memory.evictions
+        for _ in range(10):
+            for angle, image in zip((30, 90, 200), first):
+                self.assertIs(rotation_cache.get(table, (0, 0), angle)[0], image)
+        self.assertEqual(memory.evictions, evictions)
+
+    def test_masks_without_rebuilds(self):
+        image = self.sheet()
+        frame = (0, 0, 40, 30)
+        memory.set_budget(2000)
+        mask_cache.prepare(('a.png', (40, 30)), image, [frame])
+        first = [mask_cache.get(('a.png', (40, 30)), image, frame, angle) for angle in (0, 45)]
+        evictions = memory.evictions
+        for _ in range(10):
+            for angle, mask in zip((0, 45), first):
+                self.assertIs(mask_cache.get(('a.png', (40, 30)), image, frame, angle), mask)
+        self.assertEqual(memory.evictions, evictions)
+
+    def test_bundle_images_are_not_counted(self):
+        # 资源包中的图像引用映射的内存，丢弃后也不会释放
+        meta = {'world': [800, 600], 'format': 'RGBA', 'entries': [
+            {'source': 'a.png', 'rc': [1, 1], 'nums': None, 'stretch': False, 'size': [4, 4], 'offset': 0}]}
+        assets.atlas = Bundle(bytearray(4 * 4 * 4), meta, 0)
+        image = assets.atlas.get('a.png', (1, 1), None, (800, 600))
+        image_cache.put(('a.png',), image)
+        self.assertEqual(memory.total, 0)
+        self.assertEqual(memory.stats()['entries'], 0)
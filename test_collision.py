@@ -0,0 +1,60 @@
+import unittest
+
+from pygame import Rect
+
+from collision import ResponseSolver
+from gameobjects.vector2 import Vector2
+
+
+class Body(object):
+
+    def __init__(self, rect, heading=(0, 0), speed=0):
+        self.overlap_box = Rect(rect)
+        self.heading = Vector2(heading)
+        self.speed = speed
+        self.blocked_x = False
+        self.blocked_y = False
+
+
+class TestResponseSolver(unittest.TestCase):
+
+    def resolve(self, a, b):
+        solver = ResponseSolver()
+        solver.add(a, b)
+        solver.resolve()
+        return a.blocked_x, a.blocked_y
+
+    def test_narrow_overlap_blocks_x(self):
+        # 重叠区域高大于宽，只阻挡 x 方向朝向对方的移动
+        wall = Body((30, 0, 40, 40))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (1, 0), 50), wall), (True, False))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (-1, 0), 50), wall), (False, False))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (1, 1), 50), wall), (True, False))
+
+    def test_wide_overlap_blocks_y(self):
+        # 重叠区域宽大于高，只阻挡 y 方向朝向对方的移动
+        wall = Body((0, 30, 40, 40))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (0, 1), 50), wall), (False, True))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (0, -1), 50), wall), (False, False))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (1, 1), 50), wall), (False, True))
+
+    def test_square_overlap_does_not_block(self):
+        wall = Body((30, 30, 40, 40))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (1, 1), 50), wall), (False, False))
+
+    def test_still_entity_is_not_blocked(self):
+        wall = Body((30, 0, 40, 40))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40), (1, 0), 0), wall), (False, False))
+        self.assertEqual(self.resolve(Body((0, 0, 40, 40)), wall), (False, False))
+
+    def test_contacts_are_consumed(self):
+        solver = ResponseSolver(capacity=1)
+        wall = Body((30, 0, 40, 40))
+        a = Body((0, 0, 40, 40), (1, 0), 50)
+        b = Body((0, 0, 40, 40), (1, 0), 50)
+        solver.add(a, wall)
+        solver.add(b, wall)
+        solver.resolve()
+        self.assertTrue(a.blocked_x and b.blocked_x)
+        self.assertEqual(solver.count, 0)
+        self.assertEqual(solver.first[:2], [None, None])
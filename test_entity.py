@@ -0,0 +1,86 @@
+import os
+import random
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from entity import WorldBase, ListGroup
+from role import Robot
+from bullet import BounceBullet
+from gameobjects.vector2 import Vector2
+
+
+class TestAllPairs(unittest.TestCase):
+
+    def setUp(self):
+        pygame.init()
+        self.surface = pygame.display.set_mode((800, 600))
+
+    def place(self, sprite, position):
+        sprite.position = Vector2(position)
+        sprite.rect.center = position
+        sprite.update_hitbox()
+
+    def test_bullets_without_declared_pairs(self):
+        # 未声明任何组对时所有组两两检测，子弹仍然对人物造成伤害，子弹之间互不影响
+        wd = WorldBase(self.surface)
+        wd.hit_counter = 0
+        wd.kill_counter = 0
+        robot = Robot(wd)
+        self.place(robot, (400, 300))
+        hit = BounceBullet(wd, robot, (400, 300), (0, -1))
+        self.place(hit, (400, 300))
+        a = BounceBullet(wd, robot, (100, 500), (0, -1))
+        b = BounceBullet(wd, robot, (100, 500), (0, -1))
+        self.place(a, (100, 500))
+        self.place(b, (100, 500))
+        wd.process()
+        self.assertEqual(robot.hp, 90)
+        self.assertEqual(wd.hit_counter, 1)
+        self.assertFalse(hit.alive())
+        self.assertTrue(a.alive())
+        self.assertTrue(b.alive())
+
+
+class Piece(pygame.sprite.Sprite):
+
+    def __init__(self, rect, overlap=(0, False)):
+        super(Piece, self).__init__()
+        self.rect = pygame.Rect(rect)
+        self.overlap = overlap
+
+
+class TestListGroup(unittest.TestCase):
+
+    def check(self, group):
+        self.assertEqual(group.sprites(), sorted(group.spritedict, key=WorldBase.sort))
+
+    def test_order_matches_full_sort(self):
+        # 逐个插入的结果与每次整体排序一致，排序键相同时按加入的顺序排列
+        rnd = random.Random(1)
+        group = ListGroup()
+        group.sort = WorldBase.sort
+        removed = []
+        for i in range(40):
+            overlap = rnd.choice([(0, False), (0.8, False), (1, True)])
+            group.add(Piece((rnd.randint(0, 100), rnd.randint(0, 20) * 5, 10, rnd.choice([10, 20])), overlap))
+        self.check(group)
+        for step in range(300):
+            sprites = list(group.spritedict)
+            action = rnd.random()
+            if action < 0.1 and sprites:
+                sp = rnd.choice(sprites)
+                group.remove(sp)
+                removed.append(sp)
+            elif action < 0.2 and removed:
+                group.add(removed.pop(rnd.randrange(len(removed))))
+            elif action < 0.25:
+                # 大量精灵同时移动时整体重新排序
+                for sp in sprites:
+                    sp.rect.y = rnd.randint(0, 20) * 5
+            else:
+                for sp in rnd.sample(sprites, min(len(sprites), rnd.randint(1, 3))):
+                    sp.rect.move_ip(rnd.randint(-1, 1) * 5, rnd.randint(-2, 2) * 5)
+            self.check(group)
@@ -1,15 +1,27 @@
 from pygame import sprite
-from entity import WorldBase
+from entity import WorldBase, bullet_hit, bullet_edge
 from role import Robot
 from map import Edge
 
 
 class World(WorldBase):
-    def __init__(self, surface):
-        super(World, self).__init__(surface)
+    def __init__(self, surface, broadphase='grid', cell_size=64, swept_groups=('bullets',), mask_groups=('bullets',),
+                 bounds=True, dirty_rects=False):
+        super(World, self).__init__(surface, broadphase, cell_size, swept_groups, mask_groups, bounds, dirty_rects)
         self.hit_counter = 0
         self.kill_counter = 0
-        self.edge = Edge(self)
+        # 开启边界检查时不再需要边界精灵
+        self.edge = None if bounds else Edge(self)
+        # 边界、障碍物之间，以及子弹之间的碰撞没有任何效果，不进行检测
+        # 只有一个玩家，玩家之间不需要检测
+        for a, b in (('player', 'robot'), ('robot', 'robot'),
+                     ('player', 'edge'), ('robot', 'edge'),
+                     ('player', 'obstacle'), ('robot', 'obstacle'), ('bullets', 'obstacle')):
+            self.collide_pair(a, b)
+        # 子弹与人物的碰撞数量最多，使用 numpy 批量计算
+        self.collide_pair('player', 'bullets', bullet_hit, batch=True)
+        self.collide_pair('robot', 'bullets', bullet_hit, batch=True)
+        self.collide_pair('bullets', 'edge', bullet_edge)
 
     def process(self):
         super(World, self).process()